@@ -0,0 +1,442 @@
+#!/usr/bin/python
+# vim: et ts=4 sw=4 smarttab
+
+"""
+Ranking engines over the follow graph of a FriendFeed room.
+
+Every engine reads the same `pagerank.CSRGraph` and never modifies it,
+so a room's graph is built once and can be scored by in-degree, HITS,
+eigenvector centrality and PageRank in turn. The NumPy form of the
+graph is cached on it and likewise shared between engines.
+
+"""
+
+import heapq
+import pagerank
+from array import array
+from pagerank import numpy, CSRGraph, TOLERANCE, MAX_ITERATIONS
+
+
+class CentralityResult(object):
+    """
+    The outcome of an iterative centrality solve.
+
+    :Parameters:
+    - `scores`: a list of scores, one per node, summing to one
+    - `iterations`: the number of iterations performed
+    - `residual`: the L1 change over the final iteration
+
+    """
+
+    def __init__(self, scores, iterations, residual):
+        self.scores = scores
+        self.iterations = iterations
+        self.residual = residual
+
+
+    def __repr__(self):
+
+        return "<CentralityResult %d nodes, %d iterations, residual %g>" % (
+                len(self.scores), self.iterations, self.residual)
+
+
+class HITSResult(object):
+    """
+    The outcome of a HITS solve.
+
+    :Parameters:
+    - `hubs`: a list of hub scores, one per node, summing to one
+    - `authorities`: a list of authority scores, one per node, summing
+        to one
+    - `iterations`: the number of iterations performed
+    - `residual`: the L1 change in both vectors over the final
+        iteration
+
+    """
+
+    def __init__(self, hubs, authorities, iterations, residual):
+        self.hubs = hubs
+        self.authorities = authorities
+        self.iterations = iterations
+        self.residual = residual
+
+
+    def __repr__(self):
+
+        return "<HITSResult %d nodes, %d iterations, residual %g>" % (
+                len(self.hubs), self.iterations, self.residual)
+
+
+def follower_graph(followers, members=None):
+    """
+    Builds a `CSRGraph` from a dictionary mapping each nickname to the
+    nicknames following it, with an edge from each follower.
+
+    :Parameters:
+    - `followers`: a dictionary of nickname -> follower nicknames
+    - `members`: an optional list of nicknames to keep as the nodes, in
+        order; follows involving anyone else are dropped [default:
+        every nickname seen, sorted]
+
+    """
+
+    if members is None:
+        members = set(followers)
+        for names in followers.values():
+            members.update(names)
+        members = sorted(members)
+    index = dict((name, i) for i, name in enumerate(members))
+    edges = [(index[follower], index[name])
+            for name, names in followers.items() if name in index
+            for follower in names if follower in index]
+    return CSRGraph.from_edges(len(members), edges, list(members))
+
+
+def indegree_centrality(graph):
+    """
+    Returns the number of in-links of each node, read straight from
+    the row offsets.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+
+    """
+
+    indptr = graph.indptr
+    return [indptr[i + 1] - indptr[i] for i in xrange(graph.n)]
+
+
+def _numpy_destinations(arrays):
+    """
+    Returns the destination node of each edge, cached alongside the
+    graph's other NumPy arrays, so products with the transpose can be
+    taken with `numpy.bincount`.
+
+    :Parameters:
+    - `arrays`: the dictionary returned by `pagerank._numpy_arrays`
+
+    """
+
+    if 'destinations' not in arrays:
+        indptr = arrays['indptr']
+        arrays['destinations'] = numpy.repeat(
+                numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+    return arrays['destinations']
+
+
+def _array_in_sums(graph, x, out):
+    """
+    Sets `out[i]` to the sum of `x` over the in-links of node `i`.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `x`: a float array of length N
+    - `out`: the float array to receive the sums
+
+    """
+
+    indptr = graph.indptr
+    indices = graph.indices
+    start = 0
+    for i in xrange(graph.n):
+        end = indptr[i + 1]
+        total = 0.
+        for k in xrange(start, end):
+            total += x[indices[k]]
+        out[i] = total
+        start = end
+
+
+def _array_out_sums(graph, x, out):
+    """
+    Sets `out[j]` to the sum of `x` over the out-links of node `j`, by
+    scattering along the rows rather than building the transpose.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `x`: a float array of length N
+    - `out`: the float array to receive the sums
+
+    """
+
+    indptr = graph.indptr
+    indices = graph.indices
+    for j in xrange(graph.n):
+        out[j] = 0.
+    start = 0
+    for i in xrange(graph.n):
+        end = indptr[i + 1]
+        value = x[i]
+        for k in xrange(start, end):
+            out[indices[k]] += value
+        start = end
+
+
+def _scale_to_one(values):
+    """
+    Scales a float array in place so that it sums to one, leaving an
+    all-zero array alone. Returns whether the array had any mass.
+
+    :Parameters:
+    - `values`: an `array.array` of non-negative floats
+
+    """
+
+    total = sum(values)
+    if not total:
+        return False
+    for i in xrange(len(values)):
+        values[i] /= total
+    return True
+
+
+def hits(graph, tol=TOLERANCE, max_iter=MAX_ITERATIONS):
+    """
+    Computes HITS hub and authority scores by alternating power
+    iteration and returns a `HITSResult`. A node's authority is the sum
+    of the hub scores of its followers, and its hub score the sum of
+    the authorities it follows.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    n = graph.n
+    if not n:
+        return HITSResult([], [], 0, 0.)
+    if not graph.nedges:
+        return HITSResult([0.] * n, [0.] * n, 0, 0.)
+    if numpy is not None:
+        return _numpy_hits(graph, tol, max_iter)
+    hubs = array('d', [1. / n]) * n
+    authorities = array('d', [0.]) * n
+    new_hubs = array('d', [0.]) * n
+    new_authorities = array('d', [0.]) * n
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        _array_in_sums(graph, hubs, new_authorities)
+        _scale_to_one(new_authorities)
+        _array_out_sums(graph, new_authorities, new_hubs)
+        _scale_to_one(new_hubs)
+        residual = 0.
+        for i in xrange(n):
+            residual += (abs(new_hubs[i] - hubs[i]) +
+                    abs(new_authorities[i] - authorities[i]))
+        hubs, new_hubs = new_hubs, hubs
+        authorities, new_authorities = new_authorities, authorities
+        if residual < tol:
+            break
+    return HITSResult(hubs.tolist(), authorities.tolist(), iteration,
+            residual)
+
+
+def _numpy_hits(graph, tol, max_iter):
+    """
+    The vectorized form of `hits`; takes the same arguments.
+
+    :Parameters:
+    - `graph`: a `CSRGraph` with at least one edge
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    n = graph.n
+    arrays = pagerank._numpy_arrays(graph)
+    indices = arrays['indices']
+    destinations = _numpy_destinations(arrays)
+    hubs = numpy.empty(n)
+    hubs.fill(1. / n)
+    authorities = numpy.zeros(n)
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        new_authorities = pagerank._numpy_spmv(arrays, hubs)
+        new_authorities /= new_authorities.sum()
+        new_hubs = numpy.bincount(indices,
+                new_authorities[destinations], n)
+        new_hubs /= new_hubs.sum()
+        residual = float(numpy.abs(new_hubs - hubs).sum() +
+                numpy.abs(new_authorities - authorities).sum())
+        hubs = new_hubs
+        authorities = new_authorities
+        if residual < tol:
+            break
+    return HITSResult(hubs.tolist(), authorities.tolist(), iteration,
+            residual)
+
+
+def eigenvector_centrality(graph, tol=TOLERANCE, max_iter=MAX_ITERATIONS):
+    """
+    Computes eigenvector centrality, where a node's score is the sum of
+    its followers' scores, and returns a `CentralityResult`.
+
+    Iterates on `x + A x` rather than `A x`, which has the same
+    dominant eigenvector but cannot oscillate on bipartite graphs. On a
+    graph without cycles there is no unique dominant eigenvector and
+    the iteration may stop at `max_iter` with a sizeable residual.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    n = graph.n
+    if not n:
+        return CentralityResult([], 0, 0.)
+    if numpy is not None:
+        arrays = pagerank._numpy_arrays(graph)
+        state = numpy.empty(n)
+        state.fill(1. / n)
+    else:
+        state = array('d', [1. / n]) * n
+        newstate = array('d', [0.]) * n
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        if numpy is not None:
+            newstate = pagerank._numpy_spmv(arrays, state)
+            newstate += state
+            newstate /= newstate.sum()
+            residual = float(numpy.abs(newstate - state).sum())
+            state = newstate
+        else:
+            _array_in_sums(graph, state, newstate)
+            for i in xrange(n):
+                newstate[i] += state[i]
+            _scale_to_one(newstate)
+            residual = 0.
+            for i in xrange(n):
+                residual += abs(newstate[i] - state[i])
+            state, newstate = newstate, state
+        if residual < tol:
+            break
+    return CentralityResult(state.tolist(), iteration, residual)
+
+
+# Ranking engines by name. Each maps to a solver taking a graph and
+# the attribute of its result holding the scores, or None if the
+# solver returns the scores themselves; engines sharing a solver, like
+# 'hub' and 'authority', are computed together by `rank_all`.
+ENGINES = {
+        'indegree': (indegree_centrality, None),
+        'hub': (hits, 'hubs'),
+        'authority': (hits, 'authorities'),
+        'eigenvector': (eigenvector_centrality, 'scores'),
+        'pagerank': (pagerank.pagerank, 'scores'),
+}
+
+
+def rank(graph, engine='pagerank', **options):
+    """
+    Scores every node of a graph with one engine and returns a list of
+    scores, one per node.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `engine`: the name of an engine in `ENGINES`
+    - `options`: keyword arguments for the engine's solver, such as
+        `tol` or, for 'pagerank', `d` and `backend`
+
+    """
+
+    if engine not in ENGINES:
+        raise ValueError("Unknown ranking engine '%s'." % engine)
+    solver, attribute = ENGINES[engine]
+    result = solver(graph, **options)
+    if attribute is None:
+        return result
+    return getattr(result, attribute)
+
+
+def rank_all(graph, engines=None, **options):
+    """
+    Scores a graph with several engines and returns a dictionary
+    mapping each engine name to its list of scores. Each solver runs
+    once however many of its engines are asked for.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `engines`: names of engines in `ENGINES` [default: all of them]
+    - `options`: keyword arguments passed to every iterative solver,
+        i.e. `tol` and `max_iter`
+
+    """
+
+    if engines is None:
+        engines = sorted(ENGINES)
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError("Unknown ranking engine '%s'." % engine)
+    results = {}
+    scores = {}
+    for engine in engines:
+        solver, attribute = ENGINES[engine]
+        if attribute is None:
+            scores[engine] = solver(graph)
+            continue
+        if solver not in results:
+            results[solver] = solver(graph, **options)
+        scores[engine] = getattr(results[solver], attribute)
+    return scores
+
+
+def _ranking_key(pair):
+    label, score = pair
+    return -score, label
+
+
+def top_ranked(pairs, top=None):
+    """
+    Returns `(label, score)` pairs ordered highest score first, with
+    ties broken by label, lowest first.
+
+    With `top`, only the best `top` pairs are kept, by a bounded heap
+    that takes O(n log k) time and O(k) memory, so `pairs` may be a
+    stream too large to hold.
+
+    :Parameters:
+    - `pairs`: an iterable of `(label, score)` pairs
+    - `top`: the number of pairs to return [default: all]
+
+    """
+
+    if top is None:
+        return sorted(pairs, key=_ranking_key)
+    return heapq.nsmallest(top, pairs, key=_ranking_key)
+
+
+def rankings(graph, scores, top=None):
+    """
+    Returns `(label, score)` pairs for the nodes of a graph, highest
+    score first, with ties broken by label, lowest first.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `scores`: a list of scores, one per node
+    - `top`: the number of pairs to return [default: all]
+
+    """
+
+    return top_ranked(zip(graph.labels, scores), top)
+
+
+if __name__ == "__main__":
+    followers = {
+            'alice': ['bob', 'carol', 'dave'],
+            'bob': ['alice'],
+            'carol': ['alice', 'bob'],
+            'dave': [],
+    }
+    graph = follower_graph(followers)
+    for engine, scores in sorted(rank_all(graph).items()):
+        print engine, rankings(graph, scores)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# vim: et ts=4 sw=4 smarttab
+
+"""
+Converts a text edge list into the binary edge file read by
+pagerank.mmap_pagerank.
+
+"""
+
+import mmap
+import optparse
+import struct
+import sys
+from array import array
+
+import pagerank
+
+
+def make_cli_parser():
+
+    usage = "\n\n".join([
+        """\
+python %prog [OPTIONS] EDGELIST EDGEFILE
+
+ARGUMENTS:
+    EDGELIST: a text file with one "SOURCE DESTINATION" pair of
+        non-negative integer node IDs per line; blank lines and lines
+        starting with '#' are skipped
+    EDGEFILE: the binary edge file to write\
+""",
+        __doc__,
+        """\
+The edge list is read twice and never held in memory; only a count
+per node is, so lists larger than RAM can be converted.\
+"""])
+
+    cli_parser = optparse.OptionParser(usage)
+    cli_parser.add_option('-n', '--nodes', type='int',
+        help="Specify the number of nodes [default: one more than the"
+        " largest node ID]"
+    )
+
+    return cli_parser
+
+
+def iter_edge_list(path):
+    """
+    Yields `(source, destination)` pairs from a text edge list,
+    skipping self-links as `pagerank.CSRGraph` does.
+
+    NOTE: Returns an iterator.
+
+    :Parameters:
+    - `path`: the text edge list
+
+    """
+
+    infile = open(path)
+    try:
+        for lineno, line in enumerate(infile):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) < 2:
+                raise ValueError("line %d: expected two node IDs" % (
+                        lineno + 1))
+            src, dst = int(fields[0]), int(fields[1])
+            if src < 0 or dst < 0:
+                raise ValueError("line %d: node IDs must not be"
+                        " negative" % (lineno + 1))
+            if src != dst:
+                yield src, dst
+    finally:
+        infile.close()
+
+
+def convert_edge_list(edge_list_path, edge_file_path, n=None):
+    """
+    Converts a text edge list to a binary edge file sorted by
+    destination, in two passes over the text using O(N) memory: the
+    first counts the edges and the in-links of each node, finding the
+    largest ID as it goes, and the second writes every edge straight
+    into its slot in the mapped output file.
+
+    Returns the `(n, nedges)` pair written.
+
+    :Parameters:
+    - `edge_list_path`: the text edge list
+    - `edge_file_path`: the binary edge file to write
+    - `n`: the number of nodes [default: one more than the largest ID]
+
+    """
+
+    typecode = pagerank.INDPTR_TYPECODE
+    # The in-degree counts grow with the largest ID seen, doubling so
+    # they are copied only O(log N) times
+    counts = array(typecode)
+    largest = -1
+    nedges = 0
+    for src, dst in iter_edge_list(edge_list_path):
+        if src > largest or dst > largest:
+            largest = max(largest, src, dst)
+            if n is not None and largest >= n:
+                raise ValueError("node ID %d is out of range for %d"
+                        " nodes" % (largest, n))
+            if largest >= len(counts):
+                size = max(largest + 1, 2 * len(counts))
+                counts.extend(array(typecode, [0]) * (size - len(counts)))
+        counts[dst] += 1
+        nedges += 1
+    if n is None:
+        n = largest + 1
+    if len(counts) > n:
+        del counts[n:]
+    else:
+        counts.extend(array(typecode, [0]) * (n - len(counts)))
+
+    # Turn the counts into the slot of each destination's first edge
+    fill = counts
+    fill.insert(0, 0)
+    for i in xrange(n):
+        fill[i + 1] += fill[i]
+
+    header = pagerank.EDGE_FILE_HEADER
+    size = header.size + nedges * pagerank.EDGE_SIZE
+    out = open(edge_file_path, 'w+b')
+    try:
+        out.write(header.pack(pagerank.EDGE_FILE_MAGIC, n, nedges))
+        out.truncate(size)
+        out.flush()
+        buf = mmap.mmap(out.fileno(), size)
+        try:
+            pair = struct.Struct('<ii')
+            for src, dst in iter_edge_list(edge_list_path):
+                pair.pack_into(buf,
+                        header.size + fill[dst] * pagerank.EDGE_SIZE,
+                        src, dst)
+                fill[dst] += 1
+            buf.flush()
+        finally:
+            buf.close()
+    finally:
+        out.close()
+    return n, nedges
+
+
+def main(argv):
+    cli_parser = make_cli_parser()
+    opts, args = cli_parser.parse_args(argv)
+    if len(args) != 2:
+        cli_parser.error("Give an edge list and an output file")
+    edge_list_path, edge_file_path = args
+    try:
+        n, nedges = convert_edge_list(edge_list_path, edge_file_path,
+                opts.nodes)
+    except ValueError, error:
+        cli_parser.error(str(error))
+    print "Wrote %d nodes and %d edges to %s" % (n, nedges,
+            edge_file_path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -38,6 +38,8 @@ http://friendfeed.com/api/guidelines.
 import base64
 import datetime
 import pprint
+import Queue
+import threading
 import time
 import urllib
 import urllib2
@@ -64,6 +66,18 @@ except ImportError:
     pass
 
 
+# Longest URI to request; bulk requests are split to stay under it, as
+# many servers and proxies reject longer request lines.
+MAX_URI_LENGTH = 2000
+
+# Number of bulk requests to run at once
+BULK_THREADS = 4
+
+# Number of times a bulk request failing with a connection or server error
+# is retried before it is given up
+BULK_RETRIES = 1
+
+
 # Exceptions to raise for returned FriendFeed errors.
 class FriendFeedException(Exception):
     """A FriendFeed exception."""
@@ -2816,9 +2830,197 @@ class FriendFeedAPI(EqualityMixin):
 
         """
 
-        url_args = {'nickname': ','.join(nicknames)}
-        response = self._fetch('/profiles', url_args=url_args)
-        return self._parse_users(response['profiles'])
+        return self.get_bulk_user_profiles(nicknames, threads=1)[0]
+
+
+    def _chunk_nicknames(self, nicknames, max_uri_length=MAX_URI_LENGTH):
+        """
+        Splits nicknames into lists small enough that a `/profiles`
+        request for each stays within `max_uri_length` characters. A
+        nickname too long to share a request gets one of its own.
+
+        :Parameters:
+        - `nicknames`: a list of nicknames
+        - `max_uri_length`: the longest URI to request
+
+        """
+
+        base_length = len(self.make_uri('/profiles',
+                {'nickname': u'', 'format': u'json'}))
+        chunks = []
+        chunk = []
+        length = base_length
+        for nickname in nicknames:
+            # One more character for the separating comma
+            added = len(nickname) + bool(chunk)
+            if chunk and length + added > max_uri_length:
+                chunks.append(chunk)
+                chunk = []
+                length = base_length
+                added = len(nickname)
+            chunk.append(nickname)
+            length += added
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+
+    def _is_transient_error(self, error):
+        """
+        Returns True if a request failing with `error` may succeed when
+        retried: a connection error, an HTTP 5xx response or a
+        FriendFeed internal server error. Client errors such as 401,
+        403 and 404 would only fail again.
+
+        :Parameters:
+        - `error`: the exception raised by the request
+
+        """
+
+        if isinstance(error, InternalServerErrorError):
+            return True
+        if not isinstance(error, IOError):
+            return False
+        # HTTPError has a status code; URLError and socket errors do not
+        code = getattr(error, 'code', None)
+        return code is None or 500 <= code < 600
+
+
+    def _fetch_profile_chunks(self, tasks, results, retries):
+        """
+        Fetches `/profiles` for each chunk of nicknames taken from the
+        task queue until it yields None, putting a `(chunk, users,
+        error)` triple on the results queue for each. Requests failing
+        with a connection or server error are retried up to `retries`
+        times; other errors are reported at once.
+
+        :Parameters:
+        - `tasks`: a queue of lists of nicknames
+        - `results`: a queue for the outcomes
+        - `retries`: the number of times to retry a failed request
+
+        """
+
+        while True:
+            chunk = tasks.get()
+            if chunk is None:
+                break
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    url_args = {'nickname': ','.join(chunk)}
+                    response = self._fetch('/profiles', url_args=url_args)
+                    results.put((chunk, self._parse_users(
+                            response['profiles']), None))
+                except Exception, error:
+                    if attempts <= retries and self._is_transient_error(
+                            error):
+                        continue
+                    results.put((chunk, [], error))
+                break
+
+
+    def iter_bulk_user_profiles(
+            self,
+            nicknames,
+            threads=BULK_THREADS,
+            max_uri_length=MAX_URI_LENGTH,
+            retries=BULK_RETRIES
+            ):
+        """
+        Fetches the profiles of many users with `/profiles` requests
+        split to keep each URI within `max_uri_length`, up to `threads`
+        at a time, and yields a `(chunk, users, error)` triple for each
+        request as it completes: the nicknames asked for, the `User`
+        instances returned, and None. Users who were not found are left
+        out.
+
+        A request that still fails after `retries` retries does not
+        stop the others; its triple has no users and the exception as
+        `error`.
+
+        NOTE: Returns an iterator.
+
+        :Parameters:
+        - `nicknames`: a list of nicknames of the users
+        - `threads`: the number of requests to run at once
+        - `max_uri_length`: the longest URI to request
+        - `retries`: the number of times to retry a request failing
+            with a connection or server error
+
+        """
+
+        chunks = self._chunk_nicknames(nicknames, max_uri_length)
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        for chunk in chunks:
+            tasks.put(chunk)
+        workers = []
+        for i in range(max(1, min(threads, len(chunks)))):
+            tasks.put(None)
+            worker = threading.Thread(target=self._fetch_profile_chunks,
+                    args=(tasks, results, retries))
+            worker.setDaemon(True)
+            worker.start()
+            workers.append(worker)
+        for i in range(len(chunks)):
+            yield results.get()
+        for worker in workers:
+            worker.join()
+
+
+    def get_bulk_user_profiles(
+            self,
+            nicknames,
+            threads=BULK_THREADS,
+            max_uri_length=MAX_URI_LENGTH,
+            retries=BULK_RETRIES
+            ):
+        """
+        Fetches the profiles of many users, as `iter_bulk_user_profiles`
+        does, and returns the pair `(users, missing)`: a list of `User`
+        instances in the order of `nicknames`, and a list of the
+        nicknames that were not found.
+
+        Raises the first error any request still meets after its
+        retries.
+
+        :Parameters:
+        - `nicknames`: a list of nicknames of the users
+        - `threads`: the number of requests to run at once
+        - `max_uri_length`: the longest URI to request
+        - `retries`: the number of times to retry a request failing
+            with a connection or server error
+
+        """
+
+        # Ask for each user once
+        unique = []
+        seen = set()
+        for nickname in nicknames:
+            if nickname not in seen:
+                seen.add(nickname)
+                unique.append(nickname)
+        found = {}
+        failure = None
+        for chunk, users, error in self.iter_bulk_user_profiles(unique,
+                threads, max_uri_length, retries):
+            if error is not None and failure is None:
+                failure = error
+            for user in users:
+                found[user.nickname.lower()] = user
+        if failure is not None:
+            raise failure
+        users = []
+        missing = []
+        for nickname in unique:
+            user = found.get(nickname.lower())
+            if user is None:
+                missing.append(nickname)
+            else:
+                users.append(user)
+        return users, missing
 
 
     def update_multi_user_profiles(self, users):
@@ -2833,11 +3035,12 @@ class FriendFeedAPI(EqualityMixin):
         users_dict = {}
         for user in users:
             users_dict[user.nickname] = user
-        url_args = {'nickname': ','.join(users_dict.keys())}
-        response = self._fetch('/profiles', url_args=url_args)
-        for profile in response['profiles']:
-            user = users_dict[profile['nickname']]
-            self._update_user_from_profile(user, profile)
+        for chunk in self._chunk_nicknames(users_dict.keys()):
+            url_args = {'nickname': ','.join(chunk)}
+            response = self._fetch('/profiles', url_args=url_args)
+            for profile in response['profiles']:
+                user = users_dict[profile['nickname']]
+                self._update_user_from_profile(user, profile)
 
 
     def get_room_profile(self, room):
@@ -12,8 +12,11 @@ __email__ = 'chris DOT lasher <AT> gmail DOT com'
 import copy
 import datetime
 import os
+import StringIO
 import sys
 import unittest
+import urllib2
+import urlparse
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 parpath = os.path.join(MODULE_DIR, os.pardir)
@@ -1110,5 +1113,155 @@ class FriendFeedAPITests(unittest.TestCase):
             )
 
 
+class FriendFeedAPIBulkTests(unittest.TestCase):
+    """Tests for bulk profile fetching by FriendFeedAPI."""
+
+    def setUp(self):
+        self.requested = []
+        # Nicknames whose requests fail, with the number of times
+        self.failures = {}
+        # Makes the exception a failing request raises
+        self.failure = lambda uri: IOError('timed out')
+
+        def urlopen(request):
+            uri = request.get_full_url()
+            self.requested.append(uri)
+            query = urlparse.urlparse(uri).query
+            nicknames = urlparse.parse_qs(query)['nickname'][0].split(',')
+            for nickname in nicknames:
+                if self.failures.get(nickname):
+                    self.failures[nickname] -= 1
+                    raise self.failure(uri)
+            profiles = ['{"nickname": "%s"}' % nickname
+                    for nickname in nicknames if nickname != 'nobody']
+            return StringIO.StringIO('{"profiles": [%s]}' % (
+                    ', '.join(profiles)))
+
+        self.api = friendfeed.FriendFeedAPI(urlopen=urlopen)
+        self.nicknames = ['user%03d' % i for i in range(300)]
+
+
+    def test_chunk_nicknames(self):
+        """_chunk_nicknames()"""
+
+        chunks = self.api._chunk_nicknames(self.nicknames, 200)
+        self.assertEqual(sum(chunks, []), self.nicknames)
+        for chunk in chunks:
+            uri = self.api.make_uri('/profiles',
+                    {'nickname': ','.join(chunk), 'format': 'json'})
+            self.assert_(len(uri) <= 200)
+
+
+    def test_chunk_nicknames_too_long(self):
+        """_chunk_nicknames() with an overlong nickname"""
+
+        chunks = self.api._chunk_nicknames(['a' * 300, 'b', 'c'], 100)
+        self.assertEqual(chunks, [['a' * 300], ['b', 'c']])
+
+
+    def test_get_bulk_user_profiles(self):
+        """get_bulk_user_profiles()"""
+
+        nicknames = self.nicknames + ['nobody', 'user001']
+        users, missing = self.api.get_bulk_user_profiles(nicknames,
+                threads=3, max_uri_length=500)
+        self.assertEqual([user.nickname for user in users],
+                self.nicknames)
+        self.assertEqual(missing, ['nobody'])
+        self.assert_(1 < len(self.requested) < len(self.nicknames))
+        for uri in self.requested:
+            self.assert_(len(uri) <= 500)
+
+
+    def test_iter_bulk_user_profiles_failure(self):
+        """iter_bulk_user_profiles() with a failing request"""
+
+        self.failures['user150'] = 2
+        fetched = []
+        failed = []
+        for chunk, users, error in self.api.iter_bulk_user_profiles(
+                self.nicknames, threads=2, max_uri_length=500):
+            if error is None:
+                fetched.extend([user.nickname for user in users])
+            else:
+                self.assert_(isinstance(error, IOError))
+                self.assertEqual(users, [])
+                failed.extend(chunk)
+        self.assert_('user150' in failed)
+        self.assertEqual(sorted(fetched + failed), self.nicknames)
+        self.assertEqual(self.failures['user150'], 0)
+
+
+    def test_iter_bulk_user_profiles_retry(self):
+        """iter_bulk_user_profiles() retrying a failed request"""
+
+        self.failures['user150'] = 1
+        results = list(self.api.iter_bulk_user_profiles(self.nicknames,
+                max_uri_length=500))
+        self.assertEqual([error for chunk, users, error in results],
+                [None] * len(results))
+        fetched = sum([[user.nickname for user in users]
+                for chunk, users, error in results], [])
+        self.assertEqual(sorted(fetched), self.nicknames)
+
+
+    def check_retried(self, failure, retried):
+        """
+        Checks that a request failing once with the exception made by
+        `failure` is retried if `retried` and reported otherwise.
+
+        """
+
+        self.failure = failure
+        self.failures['user150'] = 1
+        results = list(self.api.iter_bulk_user_profiles(self.nicknames,
+                max_uri_length=500))
+        errors = [error for chunk, users, error in results
+                if error is not None]
+        attempts = len([uri for uri in self.requested if 'user150' in uri])
+        if retried:
+            self.assertEqual((errors, attempts), ([], 2))
+        else:
+            self.assertEqual(len(errors), 1)
+            self.assert_(isinstance(errors[0], urllib2.HTTPError))
+            self.assertEqual(attempts, 1)
+
+
+    def test_iter_bulk_user_profiles_client_error(self):
+        """iter_bulk_user_profiles() not retrying client errors"""
+
+        for code in [401, 403, 404]:
+            del self.requested[:]
+            self.check_retried(lambda uri: urllib2.HTTPError(uri, code,
+                    'Client Error', {}, None), False)
+
+
+    def test_iter_bulk_user_profiles_server_error(self):
+        """iter_bulk_user_profiles() retrying server errors"""
+
+        self.check_retried(lambda uri: urllib2.HTTPError(uri, 503,
+                'Service Unavailable', {}, None), True)
+        del self.requested[:]
+        self.check_retried(lambda uri: urllib2.URLError('refused'), True)
+        del self.requested[:]
+        self.check_retried(lambda uri: friendfeed.InternalServerErrorError(
+                'internal-server-error'), True)
+
+
+    def test_get_bulk_user_profiles_failure(self):
+        """get_bulk_user_profiles() with a failing request"""
+
+        self.failures['user150'] = 2
+        self.assertRaises(IOError, self.api.get_bulk_user_profiles,
+                self.nicknames)
+
+
+    def test_get_multi_user_profiles(self):
+        """get_multi_user_profiles()"""
+
+        users = self.api.get_multi_user_profiles(['b', 'a'])
+        self.assertEqual([user.nickname for user in users], ['b', 'a'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,30 +1,2748 @@
 #!/usr/bin/python
 # vim: et ts=4 sw=4 smarttab
 
-def pageRank(links):
-    N = len(links)
-    L = [0]*N
-    d = .85
-    for j in range(N):
-        L[j] = reduce(lambda x,y:x+y, [links[i][j] for i in range(N)])
-
-    state    = [ 1/float(N) for i in range(N) ]
-    newstate = [ 1/float(N) for i in range(N) ]
-    print state
-    for q in range(20):
-        for i in range(N):
-            newstate[i] = (1.-d) 
-            for j in range(N):
-                if i == j: 
+"""
+PageRank over the follow graph of a FriendFeed room.
+
+Graphs are held in compressed sparse row (CSR) form indexed by
+destination, so each row lists the in-links of one node and an
+iteration costs O(N + E) rather than O(N**2).
+
+"""
+
+import hashlib
+import heapq
+import math
+import os
+import random
+import struct
+import sys
+import timeit
+from array import array
+from collections import deque
+
+# NumPy is optional; without it the stdlib `array` engine is used.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# multiprocessing is missing on App Engine; only `parallel_pagerank`
+# needs it.
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+# mmap is unavailable on App Engine too; only `mmap_pagerank` needs it.
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+
+# Probability of following a link rather than teleporting
+DAMPING = .85
+# Converged once the L1 change between iterations drops below this
+TOLERANCE = 1.0e-8
+# Upper bound on iterations
+MAX_ITERATIONS = 100
+# Residual per out-link below which `local_pagerank` stops pushing
+LOCAL_EPSILON = 1.0e-4
+# Random walks per round of `montecarlo_pagerank`
+WALKS_PER_ROUND = 1000
+# Rounds the top-k set must hold still before `montecarlo_pagerank` stops
+STABLE_ROUNDS = 3
+# Edges read per chunk when streaming an edge file
+EDGE_CHUNK = 1 << 16
+# Number of personalization vectors solved together by default
+PERSONALIZATION_BLOCK = 64
+# Typecodes of the arrays holding row offsets and edge endpoints
+INDPTR_TYPECODE = 'l'
+INDEX_TYPECODE = 'i'
+# Float32 scores cannot resolve L1 residuals much below this, so it
+# floors the tolerance in compact mode
+COMPACT_TOLERANCE = 1.0e-6
+
+# Binary edge files start with this header: a magic string, then the
+# node and edge counts. Little-endian int32 (source, destination) pairs
+# follow, sorted by destination.
+EDGE_FILE_MAGIC = 'RREDGES1'
+EDGE_FILE_HEADER = struct.Struct('<8sqq')
+EDGE_SIZE = 8
+
+# Checkpoint files start with this header: a magic string, the SHA-1
+# fingerprint of the graph, the node count, the iterations completed,
+# the last residual and the damping factor. The scores follow as
+# little-endian float64s.
+CHECKPOINT_MAGIC = 'RRCHECK1'
+CHECKPOINT_HEADER = struct.Struct('<8s20sqqdd')
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 60.
+
+
+class PageRankResult(object):
+    """
+    The outcome of a PageRank solve.
+
+    :Parameters:
+    - `scores`: a list of scores, one per node, summing to one
+    - `iterations`: the number of iterations performed
+    - `residual`: the L1 change over the final iteration
+    - `relaxations`: the number of edge updates performed, where an
+        engine tracks it
+    - `visits`: the number of node updates performed, where an engine
+        tracks it
+
+    """
+
+    def __init__(self, scores, iterations, residual, relaxations=None,
+            visits=None):
+        self.scores = scores
+        self.iterations = iterations
+        self.residual = residual
+        self.relaxations = relaxations
+        self.visits = visits
+
+
+    def __repr__(self):
+
+        return "<PageRankResult %d nodes, %d iterations, residual %g>" % (
+                len(self.scores), self.iterations, self.residual)
+
+
+class MonteCarloResult(object):
+    """
+    The outcome of a Monte Carlo PageRank estimate.
+
+    :Parameters:
+    - `top`: a list of `(node, score, low, high)` tuples, best first,
+        where `low` and `high` bound the score
+    - `rounds`: the number of rounds of walks run
+    - `walks`: the total number of walks
+    - `steps`: the total number of nodes visited
+
+    """
+
+    def __init__(self, top, rounds, walks, steps):
+        self.top = top
+        self.rounds = rounds
+        self.walks = walks
+        self.steps = steps
+
+
+    def __repr__(self):
+
+        return "<MonteCarloResult top %d, %d rounds, %d walks>" % (
+                len(self.top), self.rounds, self.walks)
+
+
+class CSRGraph(object):
+    """
+    A directed graph in compressed sparse row form.
+
+    Row `i` holds the sources of the edges pointing at node `i`; that
+    is, the in-links of `i` are `indices[indptr[i]:indptr[i+1]]`.
+    Out-degrees are computed in a single pass over `indices`. Offsets
+    and indices are held in stdlib typed arrays; lists are converted.
+
+    :Parameters:
+    - `indptr`: row offsets into `indices`, of length N + 1
+    - `indices`: the source node of each edge, grouped by destination
+    - `labels`: an optional list naming each node (e.g., nicknames)
+
+    """
+
+    def __init__(self, indptr, indices, labels=None):
+
+        if not indptr:
+            raise ValueError("indptr must hold at least one offset")
+        n = len(indptr) - 1
+        if indptr[n] != len(indices):
+            raise ValueError("indptr does not match the number of edges")
+        if labels is None:
+            labels = range(n)
+        elif len(labels) != n:
+            raise ValueError("there must be one label per node")
+        if not isinstance(indptr, array):
+            indptr = array(INDPTR_TYPECODE, indptr)
+        if not isinstance(indices, array):
+            indices = array(INDEX_TYPECODE, indices)
+        self.n = n
+        self.indptr = indptr
+        self.indices = indices
+        self.labels = labels
+        # Parallel edges are kept, so an out-degree can exceed N - 1;
+        # the degrees are counted wide, then held in the narrowest of
+        # the index types that fits the largest
+        outdeg = array(INDPTR_TYPECODE, [0]) * n
+        for j in indices:
+            outdeg[j] += 1
+        largest = max(outdeg or [0])
+        for typecode in (indices.typecode, INDEX_TYPECODE):
+            if largest <= _typecode_max(typecode):
+                outdeg = array(typecode, outdeg)
+                break
+        self.outdeg = outdeg
+        self.dangling = array(indices.typecode,
+                [j for j in xrange(n) if not outdeg[j]])
+        self._numpy = {}
+        self._out_links = None
+
+
+    def __repr__(self):
+
+        return "<CSRGraph %d nodes, %d edges>" % (self.n, self.nedges)
+
+
+    def __len__(self):
+
+        return self.n
+
+
+    def _get_nedges(self):
+
+        return len(self.indices)
+
+    nedges = property(_get_nedges)
+
+
+    @classmethod
+    def from_edges(cls, n, edges, labels=None):
+        """
+        Builds a graph from an iterable of `(source, destination)` node
+        index pairs with a counting sort, in O(N + E).
+
+        Self-links are dropped, as they carry no rank between members.
+
+        :Parameters:
+        - `n`: the number of nodes
+        - `edges`: an iterable of `(source, destination)` pairs
+        - `labels`: an optional list naming each node
+
+        """
+
+        sources = array(INDEX_TYPECODE)
+        destinations = array(INDEX_TYPECODE)
+        counts = array(INDPTR_TYPECODE, [0]) * (n + 1)
+        for src, dst in edges:
+            if not (0 <= src < n and 0 <= dst < n):
+                raise ValueError("edge (%s, %s) is out of range" % (
+                        src, dst))
+            if src == dst:
+                continue
+            sources.append(src)
+            destinations.append(dst)
+            counts[dst + 1] += 1
+        indptr = counts
+        for i in range(n):
+            indptr[i + 1] += indptr[i]
+        fill = indptr[:-1]
+        indices = array(INDEX_TYPECODE, [0]) * len(sources)
+        for k in xrange(len(sources)):
+            dst = destinations[k]
+            indices[fill[dst]] = sources[k]
+            fill[dst] += 1
+        return cls(indptr, indices, labels)
+
+
+    @classmethod
+    def from_follows(cls, follows):
+        """
+        Builds a graph from a dictionary mapping each nickname to the
+        nicknames it follows. Nicknames only seen as followees become
+        nodes too.
+
+        :Parameters:
+        - `follows`: a dictionary of nickname -> followed nicknames
+
+        """
+
+        labels = set(follows)
+        for followees in follows.values():
+            labels.update(followees)
+        labels = sorted(labels)
+        index = dict((label, i) for i, label in enumerate(labels))
+        edges = [(index[follower], index[followee])
+                for follower, followees in follows.items()
+                for followee in followees]
+        return cls.from_edges(len(labels), edges, labels)
+
+
+    @classmethod
+    def from_links(cls, links):
+        """
+        Builds a graph from a dense N x N link matrix, where a positive
+        `links[i][j]` means node `j` links to node `i`.
+
+        :Parameters:
+        - `links`: a list of lists
+
+        """
+
+        n = len(links)
+        edges = [(j, i) for i in range(n) for j in range(n)
+                if links[i][j] > 0]
+        return cls.from_edges(n, edges)
+
+
+    def edges(self):
+        """
+        Yields each edge as a `(source, destination)` index pair, in
+        order of destination.
+
+        NOTE: Returns an iterator.
+
+        """
+
+        indptr = self.indptr
+        indices = self.indices
+        for i in xrange(self.n):
+            for k in xrange(indptr[i], indptr[i + 1]):
+                yield indices[k], i
+
+
+    def out_links(self):
+        """
+        Returns `(out_indptr, out_indices)`, the transpose of the graph
+        in CSR form, so the out-links of `j` are
+        `out_indices[out_indptr[j]:out_indptr[j+1]]`. It is built on
+        first use and cached.
+
+        """
+
+        if self._out_links is None:
+            n = self.n
+            out_indptr = array(INDPTR_TYPECODE, [0]) * (n + 1)
+            for j in xrange(n):
+                out_indptr[j + 1] = out_indptr[j] + self.outdeg[j]
+            fill = out_indptr[:-1]
+            out_indices = array(INDEX_TYPECODE, [0]) * self.nedges
+            for src, dst in self.edges():
+                out_indices[fill[src]] = dst
+                fill[src] += 1
+            self._out_links = (out_indptr, out_indices)
+        return self._out_links
+
+
+    def compact(self):
+        """
+        Returns a copy of the graph using the narrowest index arrays
+        that fit: unsigned 16-bit node indices for rooms of up to 65536
+        members, and 32-bit row offsets unless there are 2**31 edges or
+        more. Out-degrees share the index type unless parallel edges
+        push one past it.
+
+        """
+
+        if self.n <= 1 << 16:
+            index_typecode = 'H'
+        else:
+            index_typecode = 'i'
+        if self.nedges < 1 << 31:
+            indptr_typecode = 'i'
+        else:
+            indptr_typecode = INDPTR_TYPECODE
+        return CSRGraph(array(indptr_typecode, self.indptr),
+                array(index_typecode, self.indices), self.labels)
+
+
+    def neighbors(self, i):
+        """
+        Returns the nodes linked to or from node `i`, ignoring direction.
+
+        :Parameters:
+        - `i`: a node index
+
+        """
+
+        out_indptr, out_indices = self.out_links()
+        return (self.indices[self.indptr[i]:self.indptr[i + 1]].tolist() +
+                out_indices[out_indptr[i]:out_indptr[i + 1]].tolist())
+
+
+    def permute(self, order):
+        """
+        Returns a copy of the graph with its nodes relabeled, so that
+        node `order[k]` of this graph becomes node `k`. Labels move
+        with their nodes.
+
+        :Parameters:
+        - `order`: a permutation of the node indices
+
+        """
+
+        n = self.n
+        if len(order) != n:
+            raise ValueError("order must list every node once")
+        rank = array(INDEX_TYPECODE, [-1]) * n
+        for new, old in enumerate(order):
+            if rank[old] != -1:
+                raise ValueError("order must list every node once")
+            rank[old] = new
+        labels = [self.labels[old] for old in order]
+        edges = ((rank[src], rank[dst]) for src, dst in self.edges())
+        return self.from_edges(n, edges, labels)
+
+
+    def scores_by_label(self, scores):
+        """
+        Returns a dictionary mapping each node's label to its score.
+
+        :Parameters:
+        - `scores`: a sequence of scores, one per node
+
+        """
+
+        return dict(zip(self.labels, scores))
+
+
+    def apply_delta(self, added=(), removed=(), removed_nodes=(),
+            added_nodes=()):
+        """
+        Returns a new graph with nodes and edges added and removed. Edges
+        are `(source, destination)` pairs of labels. Surviving nodes keep
+        their relative order and labels; labels first seen in
+        `added_nodes`, then in `added`, are appended as new nodes.
+
+        :Parameters:
+        - `added`: edges to add; edges already present are ignored
+        - `removed`: edges to remove
+        - `removed_nodes`: labels of nodes to remove with their edges
+        - `added_nodes`: labels of nodes to add, with or without edges;
+          nodes already present are ignored
+
+        """
+
+        removed_nodes = set(removed_nodes)
+        removed = set(removed)
+        added = list(added)
+        labels = [label for label in self.labels
+                if label not in removed_nodes]
+        index = dict((label, i) for i, label in enumerate(labels))
+        new_labels = list(added_nodes)
+        for edge in added:
+            new_labels.extend(edge)
+        for label in new_labels:
+            if label in removed_nodes:
+                raise ValueError("cannot add removed node %r" % (label,))
+            if label not in index:
+                index[label] = len(labels)
+                labels.append(label)
+        pending = set(added) - removed
+        old_labels = self.labels
+        edges = []
+        for src, dst in self.edges():
+            edge = (old_labels[src], old_labels[dst])
+            if edge in removed or edge[0] in removed_nodes or \
+                    edge[1] in removed_nodes:
+                continue
+            pending.discard(edge)
+            edges.append((index[edge[0]], index[edge[1]]))
+        for src, dst in added:
+            if (src, dst) in pending:
+                pending.discard((src, dst))
+                edges.append((index[src], index[dst]))
+        return self.from_edges(len(labels), edges, labels)
+
+
+def _typecode_max(typecode):
+    """
+    Returns the largest value an integer array of the given type holds.
+
+    :Parameters:
+    - `typecode`: an integer `array` typecode, e.g. 'H' or 'i'
+
+    """
+
+    bits = 8 * array(typecode).itemsize
+    if typecode.islower():
+        # Signed
+        bits -= 1
+    return (1 << bits) - 1
+
+
+def _start_vector(n, start):
+    """
+    Returns the initial state as a float array summing to one: uniform
+    if `start` is None, otherwise a normalized copy of `start`.
+
+    :Parameters:
+    - `n`: the number of nodes
+    - `start`: None or a sequence of N non-negative scores
+
+    """
+
+    if start is None:
+        return array('d', [1. / n]) * n
+    if len(start) != n:
+        raise ValueError("start must have one score per node")
+    state = array('d', start)
+    if sum(state) <= 0:
+        raise ValueError("start must have positive mass")
+    _normalize(state)
+    return state
+
+
+def _numpy_from_array(values):
+    """
+    Returns a NumPy view of a stdlib typed array without copying.
+
+    :Parameters:
+    - `values`: an `array.array`
+
+    """
+
+    if not len(values):
+        return numpy.zeros(0, dtype=values.typecode)
+    return numpy.frombuffer(values, dtype=values.typecode)
+
+
+def _numpy_arrays(graph, compact=False):
+    """
+    Returns the NumPy form of a graph's CSR arrays, built on first use
+    and cached on the graph.
+
+    In compact mode the index arrays are zero-copy views of the
+    graph's own arrays, whatever their width, and the reciprocal
+    out-degrees are float32.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `compact`: whether to build the compact form
+
+    """
+
+    if compact not in graph._numpy:
+        if compact:
+            indptr = _numpy_from_array(graph.indptr)
+            indices = _numpy_from_array(graph.indices)
+            dangling = _numpy_from_array(graph.dangling)
+            dtype = numpy.float32
+        else:
+            indptr = _numpy_from_array(graph.indptr).astype(numpy.intp)
+            indices = _numpy_from_array(graph.indices).astype(numpy.intp)
+            dangling = numpy.array(graph.dangling, dtype=numpy.intp)
+            dtype = numpy.float64
+        outdeg = _numpy_from_array(graph.outdeg)
+        inv_outdeg = numpy.zeros(graph.n, dtype)
+        linked = outdeg > 0
+        inv_outdeg[linked] = 1. / outdeg[linked]
+        # reduceat needs strictly increasing offsets, so only the
+        # non-empty rows are summed
+        rows = numpy.flatnonzero(indptr[1:] > indptr[:-1])
+        graph._numpy[compact] = {
+                'indptr': indptr,
+                'indices': indices,
+                'inv_outdeg': inv_outdeg,
+                'dangling': dangling,
+                'rows': rows,
+                'offsets': indptr[rows],
+        }
+    return graph._numpy[compact]
+
+
+def _numpy_spmv(arrays, x):
+    """
+    Sums `x` over the in-links of every node; `x` may be a vector or a
+    matrix with one column per right-hand side.
+
+    :Parameters:
+    - `arrays`: the dictionary returned by `_numpy_arrays`
+    - `x`: an array with one row per node
+
+    """
+
+    out = numpy.zeros(x.shape, x.dtype)
+    if len(arrays['indices']):
+        out[arrays['rows']] = numpy.add.reduceat(
+                x[arrays['indices']], arrays['offsets'], axis=0)
+    return out
+
+
+def numpy_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        start=None,
+        compact=False
+        ):
+    """
+    Runs vectorized power iteration until the L1 residual drops below
+    `tol`, or `max_iter` iterations have run. Returns a
+    `PageRankResult`.
+
+    NOTE: Requires NumPy.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores, e.g. a previous solution
+        [default: uniform]
+    - `compact`: whether to iterate in place on float32 vectors (see
+        `CSRGraph.compact`); `tol` is floored at `COMPACT_TOLERANCE`
+
+    """
+
+    if numpy is None:
+        raise ImportError("NumPy is required for numpy_pagerank.")
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0.)
+    if compact:
+        return _numpy_compact_pagerank(graph, d, max(tol,
+                COMPACT_TOLERANCE), max_iter, start)
+    arrays = _numpy_arrays(graph)
+    state = _numpy_from_array(_start_vector(n, start))
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        newstate = _numpy_spmv(arrays, state * arrays['inv_outdeg'])
+        newstate *= d
+        newstate += ((1. - d) + d * state[arrays['dangling']].sum()) / n
+        residual = float(numpy.abs(newstate - state).sum())
+        state = newstate
+        if residual < tol:
+            break
+    return PageRankResult(state.tolist(), iteration, residual)
+
+
+def _numpy_compact_pagerank(graph, d, tol, max_iter, start):
+    """
+    The compact mode of `numpy_pagerank`: float32 vectors, index
+    arrays as narrow as the graph's own, and every iteration computed
+    in place in buffers allocated up front.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores
+
+    """
+
+    n = graph.n
+    arrays = _numpy_arrays(graph, True)
+    inv_outdeg = arrays['inv_outdeg']
+    indices = arrays['indices']
+    dangling = arrays['dangling']
+    rows = arrays['rows']
+    offsets = arrays['offsets']
+    state = _numpy_from_array(_start_vector(n, start)).astype(numpy.float32)
+    newstate = numpy.empty(n, numpy.float32)
+    contrib = numpy.empty(n, numpy.float32)
+    gathered = numpy.empty(len(indices), numpy.float32)
+    sums = numpy.empty(len(rows), numpy.float32)
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        numpy.multiply(state, inv_outdeg, contrib)
+        newstate.fill(0.)
+        if len(indices):
+            numpy.take(contrib, indices, out=gathered)
+            numpy.add.reduceat(gathered, offsets, out=sums)
+            newstate[rows] = sums
+        newstate *= d
+        newstate += ((1. - d) +
+                d * state[dangling].sum(dtype=numpy.float64)) / n
+        numpy.subtract(newstate, state, contrib)
+        numpy.abs(contrib, contrib)
+        residual = float(contrib.sum(dtype=numpy.float64))
+        state, newstate = newstate, state
+        if residual < tol:
+            break
+    return PageRankResult(state.tolist(), iteration, residual)
+
+
+def array_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        start=None,
+        compact=False
+        ):
+    """
+    Runs power iteration using only the stdlib `array` module, for
+    environments such as App Engine where NumPy cannot be imported.
+    Takes the same arguments as `numpy_pagerank` and returns a
+    `PageRankResult`.
+
+    The state is double-buffered between two preallocated float arrays
+    that swap roles each iteration, so no lists are allocated while
+    iterating.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores, e.g. a previous solution
+        [default: uniform]
+    - `compact`: whether to hold the vectors as float32 (see
+        `CSRGraph.compact`); `tol` is floored at `COMPACT_TOLERANCE`
+
+    """
+
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0.)
+    typecode = 'd'
+    if compact:
+        typecode = 'f'
+        tol = max(tol, COMPACT_TOLERANCE)
+    inv_outdeg = _array_inv_outdeg(graph, typecode)
+    state = array(typecode, _start_vector(n, start))
+    newstate = array(typecode, [0.]) * n
+    contrib = array(typecode, [0.]) * n
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        residual = _array_step(graph, inv_outdeg, d, state, newstate,
+                contrib)
+        state, newstate = newstate, state
+        if residual < tol:
+            break
+    return PageRankResult(state.tolist(), iteration, residual)
+
+
+def _array_inv_outdeg(graph, typecode='d'):
+    """
+    Returns a float array of reciprocal out-degrees, zero for dangling
+    nodes.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `typecode`: 'd' for float64 or 'f' for float32
+
+    """
+
+    inv_outdeg = array(typecode, [0.]) * graph.n
+    for j, degree in enumerate(graph.outdeg):
+        if degree:
+            inv_outdeg[j] = 1. / degree
+    return inv_outdeg
+
+
+def _array_step(graph, inv_outdeg, d, state, newstate, contrib,
+        teleport=None):
+    """
+    Performs one power iteration from `state` into `newstate` and
+    returns the L1 residual between them. `contrib` is scratch space
+    of length N.
+
+    Teleports, and the rank of dangling nodes, land uniformly unless a
+    `teleport` distribution is given.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `inv_outdeg`: the array returned by `_array_inv_outdeg`
+    - `d`: the damping factor
+    - `state`: the current scores
+    - `newstate`: the array to receive the next scores
+    - `contrib`: scratch space for each node's share of rank
+    - `teleport`: an optional float array summing to one
+
+    """
+
+    n = graph.n
+    indptr = graph.indptr
+    indices = graph.indices
+    dangling_sum = 0.
+    for j in graph.dangling:
+        dangling_sum += state[j]
+    for j in xrange(n):
+        contrib[j] = state[j] * inv_outdeg[j]
+    jump = (1. - d) + d * dangling_sum
+    base = jump / n
+    residual = 0.
+    start = 0
+    for i in xrange(n):
+        end = indptr[i + 1]
+        total = 0.
+        for k in xrange(start, end):
+            total += contrib[indices[k]]
+        if teleport is not None:
+            base = jump * teleport[i]
+        value = base + d * total
+        residual += abs(value - state[i])
+        newstate[i] = value
+        start = end
+    return residual
+
+
+def _normalize(values):
+    """
+    Scales a float array in place so that it sums to one.
+
+    :Parameters:
+    - `values`: a float array
+
+    """
+
+    total = sum(values)
+    if total > 0:
+        scale = 1. / total
+        for i in xrange(len(values)):
+            values[i] *= scale
+
+
+def _quadratic_extrapolate(history, out):
+    """
+    Quadratic extrapolation (Kamvar et al., 2003) of the last four
+    iterates into `out`. Returns False if the estimate is unusable.
+
+    :Parameters:
+    - `history`: the iterates, oldest first
+    - `out`: a float array to receive the estimate
+
+    """
+
+    x0, x1, x2, x3 = history[-4:]
+    # Least-squares fit of gamma1 * y1 + gamma2 * y2 = -y3 where
+    # yk = xk - x0, solved through its 2 x 2 normal equations
+    a11 = a12 = a22 = b1 = b2 = 0.
+    for i in xrange(len(out)):
+        base = x0[i]
+        y1 = x1[i] - base
+        y2 = x2[i] - base
+        y3 = x3[i] - base
+        a11 += y1 * y1
+        a12 += y1 * y2
+        a22 += y2 * y2
+        b1 -= y1 * y3
+        b2 -= y2 * y3
+    det = a11 * a22 - a12 * a12
+    if abs(det) <= 1e-300:
+        return False
+    gamma1 = (b1 * a22 - b2 * a12) / det
+    gamma2 = (a11 * b2 - a12 * b1) / det
+    beta0 = gamma1 + gamma2 + 1.
+    beta1 = gamma2 + 1.
+    for i in xrange(len(out)):
+        value = beta0 * x1[i] + beta1 * x2[i] + x3[i]
+        if value <= 0.:
+            return False
+        out[i] = value
+    return True
+
+
+# Extrapolation methods by name, with the number of iterates each needs
+EXTRAPOLATIONS = {
+        'quadratic': (_quadratic_extrapolate, 4),
+}
+
+
+def _gauss_seidel_pagerank(graph, d, tol, max_iter):
+    """
+    Sweeps the nodes in order, updating each score in place so that
+    later nodes in the sweep already see the new values. The sweep is
+    renormalized at the end, as the dangling mass is taken from its
+    start.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    n = graph.n
+    indptr = graph.indptr
+    indices = graph.indices
+    inv_outdeg = _array_inv_outdeg(graph)
+    state = array('d', [1. / n]) * n
+    previous = array('d', [0.]) * n
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        previous[:] = state
+        dangling_sum = 0.
+        for j in graph.dangling:
+            dangling_sum += state[j]
+        base = ((1. - d) + d * dangling_sum) / n
+        start = 0
+        for i in xrange(n):
+            end = indptr[i + 1]
+            total = 0.
+            for k in xrange(start, end):
+                j = indices[k]
+                total += state[j] * inv_outdeg[j]
+            state[i] = base + d * total
+            start = end
+        _normalize(state)
+        residual = 0.
+        for i in xrange(n):
+            residual += abs(state[i] - previous[i])
+        if residual < tol:
+            break
+    return PageRankResult(state.tolist(), iteration, residual)
+
+
+def accelerated_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        method='quadratic',
+        period=10
+        ):
+    """
+    Runs an accelerated PageRank solve and returns a `PageRankResult`.
+    Each iteration is one pass over the edges, so iteration counts are
+    directly comparable with `array_pagerank`.
+
+    With 'quadratic', power iteration is interrupted every `period`
+    iterations to extrapolate from the last four iterates. Estimates
+    with non-positive scores are discarded, as are those whose next
+    step does not lower the residual: the plain iterate is stepped from
+    instead, at the cost of one wasted pass. Extrapolation pays off
+    most on slowly mixing graphs. With 'gauss-seidel', the sweep
+    updates scores in place instead.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `method`: 'quadratic' or 'gauss-seidel'
+    - `period`: iterations between extrapolations
+
+    """
+
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0.)
+    if method == 'gauss-seidel':
+        return _gauss_seidel_pagerank(graph, d, tol, max_iter)
+    if method not in EXTRAPOLATIONS:
+        raise ValueError("Unknown acceleration method '%s'." % method)
+    extrapolate, needed = EXTRAPOLATIONS[method]
+    period = max(period, needed)
+    inv_outdeg = _array_inv_outdeg(graph)
+    # The iterates are kept oldest first; each step overwrites the
+    # oldest buffer, so nothing is allocated while iterating
+    history = [array('d', [1. / n]) * n for i in range(needed)]
+    contrib = array('d', [0.]) * n
+    scratch = array('d', [0.]) * n
+    iteration = 0
+    residual = float('inf')
+    # While an estimate is on trial, `scratch` holds the plain iterate
+    # it replaced and `expected` the residual it must beat
+    expected = None
+    while iteration < max_iter:
+        iteration += 1
+        newstate = history.pop(0)
+        residual = _array_step(graph, inv_outdeg, d, history[-1], newstate,
+                contrib)
+        history.append(newstate)
+        if expected is not None:
+            if residual >= expected and iteration < max_iter:
+                # The estimate did not lower the residual; step from the
+                # plain iterate instead
+                history[-2], scratch = scratch, history[-2]
+                iteration += 1
+                residual = _array_step(graph, inv_outdeg, d, history[-2],
+                        history[-1], contrib)
+            expected = None
+        if residual < tol:
+            break
+        if iteration % period == 0 and extrapolate(history, scratch):
+            _normalize(scratch)
+            history[-1], scratch = scratch, history[-1]
+            expected = residual
+    return PageRankResult(history[-1].tolist(), iteration, residual)
+
+
+def compare_acceleration(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        method='quadratic',
+        period=10
+        ):
+    """
+    Solves a graph with both `array_pagerank` and
+    `accelerated_pagerank`, and returns the pair of `PageRankResult`
+    instances so their iteration counts can be compared.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `method`: 'quadratic' or 'gauss-seidel'
+    - `period`: iterations between extrapolations
+
+    """
+
+    plain = array_pagerank(graph, d, tol, max_iter)
+    accelerated = accelerated_pagerank(graph, d, tol, max_iter, method,
+            period)
+    return plain, accelerated
+
+
+def delta_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        start=None
+        ):
+    """
+    Runs asynchronous delta-PageRank: rather than sweeping every node,
+    pushes each node's pending change along its out-links only once it
+    is large relative to the cost of pushing it. Takes the same
+    arguments as `array_pagerank` and returns a `PageRankResult`, with
+    `iterations` counting threshold passes, `relaxations` counting
+    edge updates and `visits` counting node updates.
+
+    The pushes solve y = d * A * y + b, whose solution is proportional
+    to PageRank for any b > 0 (see `scc_pagerank`). Changing b shifts
+    every pending change by the same amount and only rescales the
+    solution, so each pass starts by shifting the pending changes to
+    a median of zero. The pass then pushes every node whose pending
+    change exceeds a threshold times the square root of its out-degree
+    plus one, and the threshold halves for the next pass, so the
+    largest changes per edge are pushed first.
+
+    With NumPy, the scans between passes (the median, found by selection,
+    the error bound and the next pass's queue) are vectorized.
+
+    Stops once the error bound 2 * |r| / ((1 - d) * |y|), where r is
+    the pending change, is below `tol`; the bound is the residual
+    reported.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 error to aim for
+    - `max_iter`: the maximum number of threshold passes
+    - `start`: optional initial scores, e.g. a previous solution
+        [default: uniform]
+
+    """
+
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0., 0, 0)
+    out_indptr, out_indices = graph.out_links()
+    inv_outdeg = _array_inv_outdeg(graph)
+    # A normalized solution x corresponds to y = x / (1 - d + d * D),
+    # where D is the rank held by dangling nodes; the pending change at
+    # each node is what one more step of the equation would add
+    y = _start_vector(n, start)
+    dangling_sum = 0.
+    for j in graph.dangling:
+        dangling_sum += y[j]
+    scale = 1. / ((1. - d) + d * dangling_sum)
+    for i in xrange(n):
+        y[i] *= scale
+    indptr = graph.indptr
+    indices = graph.indices
+    pending = array('d', [0.]) * n
+    for i in xrange(n):
+        total = 0.
+        for k in xrange(indptr[i], indptr[i + 1]):
+            j = indices[k]
+            total += y[j] * inv_outdeg[j]
+        pending[i] = 1. / n + d * total - y[i]
+    relaxations = graph.nedges
+    visits = n
+    # A node is pushed once the square of its pending change exceeds
+    # the squared threshold times its out-degree plus one. `limit` holds
+    # that bound for each node, or infinity while the node is queued,
+    # so each relaxation costs one comparison.
+    weight2 = array('d', [(out_indptr[u + 1] - out_indptr[u]) + 1.
+            for u in xrange(n)])
+    limit = array('d', [0.]) * n
+    infinity = float('inf')
+    if numpy is not None:
+        pending_view = _numpy_from_array(pending)
+        weight2_view = _numpy_from_array(weight2)
+        limit_view = _numpy_from_array(limit)
+
+    total = sum(y)
+    threshold2 = None
+    iteration = 0
+    while True:
+        if numpy is not None:
+            # Selection finds the median without sorting
+            pending_view -= numpy.partition(pending_view, n // 2)[n // 2]
+            outstanding = float(numpy.abs(pending_view).sum())
+            squares = pending_view * pending_view
+            largest2 = float((squares / weight2_view).max())
+        else:
+            median = sorted(pending)[n // 2]
+            outstanding = largest2 = 0.
+            for u in xrange(n):
+                value = pending[u] - median
+                pending[u] = value
+                outstanding += abs(value)
+                ratio = value * value / weight2[u]
+                if ratio > largest2:
+                    largest2 = ratio
+        if (iteration >= max_iter or
+                2. * outstanding <= tol * (1. - d) * total):
+            break
+        iteration += 1
+        if threshold2 is None or threshold2 > largest2:
+            threshold2 = largest2
+        threshold2 *= .25
+        if numpy is not None:
+            numpy.multiply(weight2_view, threshold2, limit_view)
+            queue = numpy.flatnonzero(squares > limit_view).tolist()
+            limit_view[queue] = infinity
+        else:
+            queue = []
+            for u in xrange(n):
+                value = pending[u]
+                if value * value > threshold2 * weight2[u]:
+                    limit[u] = infinity
+                    queue.append(u)
+                else:
+                    limit[u] = threshold2 * weight2[u]
+        while queue:
+            current, queue = queue, []
+            visits += len(current)
+            for u in current:
+                limit[u] = threshold2 * weight2[u]
+                change = pending[u]
+                pending[u] = 0.
+                y[u] += change
+                total += change
+                share = d * change * inv_outdeg[u]
+                if not share:
                     continue
-                if links[i][j] > 0:
-                    newstate[i] += d*state[j] / L[j]
+                lo = out_indptr[u]
+                hi = out_indptr[u + 1]
+                for v in out_indices[lo:hi]:
+                    after = pending[v] + share
+                    pending[v] = after
+                    if after * after > limit[v]:
+                        limit[v] = infinity
+                        queue.append(v)
+                relaxations += hi - lo
+    total = sum(y)
+    residual = 2. * outstanding / ((1. - d) * total)
+    scores = [value / total for value in y]
+    return PageRankResult(scores, iteration, residual, relaxations,
+            visits)
+
+
+# The shared arrays of a `parallel_pagerank` run, as seen by a worker
+_parallel_shared = None
+
+
+def _parallel_init(shared):
+    """
+    Pool initializer: keeps the shared arrays, inherited rather than
+    pickled, as module state. With NumPy they are wrapped in
+    zero-copy views.
+
+    :Parameters:
+    - `shared`: a dictionary of `multiprocessing.RawArray` instances
+
+    """
+
+    global _parallel_shared
+    if numpy is not None:
+        views = {}
+        for name, value in shared.items():
+            if isinstance(value, tuple):
+                views[name] = tuple([numpy.frombuffer(buf, dtype=buf._type_)
+                        for buf in value])
+            else:
+                views[name] = numpy.frombuffer(value, dtype=value._type_)
+        shared = views
+    _parallel_shared = shared
+
+
+def _parallel_rows(task):
+    """
+    Computes one block of rows of a parallel iteration. Reads the
+    current state and contributions, writes the next ones for its own
+    rows, and returns `(residual, dangling_sum)` for the block.
+
+    :Parameters:
+    - `task`: a tuple `(lo, hi, flip, base, d)` giving the rows, the
+        current buffer, the teleport term and the damping factor
+
+    """
+
+    lo, hi, flip, base, d = task
+    shared = _parallel_shared
+    indptr = shared['indptr']
+    indices = shared['indices']
+    inv_outdeg = shared['inv_outdeg']
+    state = shared['state'][flip]
+    newstate = shared['state'][1 - flip]
+    contrib = shared['contrib'][flip]
+    next_contrib = shared['contrib'][1 - flip]
+    if numpy is not None:
+        offsets = indptr[lo:hi + 1]
+        values = numpy.zeros(hi - lo)
+        if offsets[-1] > offsets[0]:
+            rows = numpy.flatnonzero(offsets[1:] > offsets[:-1])
+            values[rows] = numpy.add.reduceat(
+                    contrib[indices[offsets[0]:offsets[-1]]],
+                    offsets[rows] - offsets[0])
+        values *= d
+        values += base
+        residual = float(numpy.abs(values - state[lo:hi]).sum())
+        newstate[lo:hi] = values
+        weights = inv_outdeg[lo:hi]
+        next_contrib[lo:hi] = values * weights
+        dangling_sum = float(values[weights == 0].sum())
+        return residual, dangling_sum
+
+    residual = 0.
+    dangling_sum = 0.
+    start = indptr[lo]
+    for i in xrange(lo, hi):
+        end = indptr[i + 1]
+        total = 0.
+        for k in xrange(start, end):
+            total += contrib[indices[k]]
+        value = base + d * total
+        residual += abs(value - state[i])
+        newstate[i] = value
+        next_contrib[i] = value * inv_outdeg[i]
+        if not inv_outdeg[i]:
+            dangling_sum += value
+        start = end
+    return residual, dangling_sum
+
+
+def _row_blocks(graph, nblocks):
+    """
+    Splits the rows into at most `nblocks` contiguous `(lo, hi)` ranges
+    of roughly equal work, counting one unit per row and per edge.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `nblocks`: the number of blocks wanted
+
+    """
+
+    n = graph.n
+    indptr = graph.indptr
+    target = float(n + graph.nedges) / max(nblocks, 1)
+    blocks = []
+    lo = 0
+    for i in xrange(1, n + 1):
+        if i == n or (i + indptr[i]) - (lo + indptr[lo]) >= target:
+            blocks.append((lo, i))
+            lo = i
+    return blocks
+
+
+def parallel_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        start=None,
+        processes=None,
+        blocks=None
+        ):
+    """
+    Runs power iteration with the CSR rows split into blocks across a
+    `multiprocessing` pool. Takes the same arguments as
+    `array_pagerank`, plus the pool size, and returns a
+    `PageRankResult`.
+
+    The edge arrays and the double-buffered state and contribution
+    vectors live in shared memory that the workers inherit when the
+    pool starts, so nothing but row ranges and scalars is pickled per
+    iteration. Each worker also prepares the next contributions of its
+    own rows, leaving one barrier per iteration.
+
+    NOTE: Requires multiprocessing with the fork start method.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores [default: uniform]
+    - `processes`: the number of worker processes [default: one per
+        CPU]
+    - `blocks`: the number of row blocks [default: four per process]
+
+    """
+
+    if multiprocessing is None:
+        raise ImportError("multiprocessing is required for"
+                " parallel_pagerank.")
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0.)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if blocks is None:
+        blocks = 4 * processes
+    RawArray = multiprocessing.RawArray
+    state = _start_vector(n, start)
+    inv_outdeg = _array_inv_outdeg(graph)
+    contrib = array('d', [0.]) * n
+    dangling_sum = 0.
+    for j in xrange(n):
+        contrib[j] = state[j] * inv_outdeg[j]
+        if not inv_outdeg[j]:
+            dangling_sum += state[j]
+    shared = {
+            'indptr': RawArray(graph.indptr.typecode, graph.indptr),
+            'indices': RawArray(graph.indices.typecode,
+                graph.indices or [0]),
+            'inv_outdeg': RawArray('d', inv_outdeg),
+            'state': (RawArray('d', state), RawArray('d', n)),
+            'contrib': (RawArray('d', contrib), RawArray('d', n)),
+    }
+    bounds = _row_blocks(graph, blocks)
+    pool = multiprocessing.Pool(processes, _parallel_init, (shared,))
+    try:
+        flip = 0
+        iteration = 0
+        residual = float('inf')
+        while iteration < max_iter:
+            iteration += 1
+            base = ((1. - d) + d * dangling_sum) / n
+            tasks = [(lo, hi, flip, base, d) for lo, hi in bounds]
+            parts = pool.map(_parallel_rows, tasks)
+            residual = sum([part[0] for part in parts])
+            dangling_sum = sum([part[1] for part in parts])
+            flip = 1 - flip
+            if residual < tol:
+                break
+    finally:
+        pool.close()
+        pool.join()
+    return PageRankResult(shared['state'][flip][:], iteration, residual)
+
+
+# PageRank engines by name; all take the graph, d, tol, max_iter and
+# start arguments in that order
+BACKENDS = {
+        'array': array_pagerank,
+        'delta': delta_pagerank,
+        'numpy': numpy_pagerank,
+        'parallel': parallel_pagerank,
+}
+# The engines that also take `compact`
+COMPACT_BACKENDS = set(['array', 'numpy'])
+
+
+def default_backend():
+    """
+    Returns the name of the fastest engine available here: 'numpy' if
+    NumPy can be imported, otherwise 'array'.
+
+    """
+
+    if numpy is not None:
+        return 'numpy'
+    return 'array'
+
+
+def pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        backend=None,
+        start=None,
+        compact=False
+        ):
+    """
+    Computes PageRank scores for a `CSRGraph` and returns a
+    `PageRankResult`.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `backend`: the name of an engine in `BACKENDS` [default: the
+        result of `default_backend()`]
+    - `start`: optional initial scores [default: uniform]
+    - `compact`: whether to use float32 vectors; supported by the
+        engines in `COMPACT_BACKENDS`
+
+    """
+
+    if backend is None:
+        backend = default_backend()
+    if backend not in BACKENDS:
+        raise ValueError("Unknown PageRank backend '%s'." % backend)
+    if compact and backend not in COMPACT_BACKENDS:
+        raise ValueError("The '%s' backend has no compact mode." %
+                backend)
+    if compact:
+        return BACKENDS[backend](graph, d, tol, max_iter, start,
+                compact=True)
+    return BACKENDS[backend](graph, d, tol, max_iter, start)
+
+
+def footprint(graph, backend=None, compact=False):
+    """
+    Returns the pair `(bytes_per_node, bytes_per_edge)` of working
+    memory an engine uses for a graph: the graph's own arrays, the
+    score vectors and, for NumPy, its index copies and gather buffer.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `backend`: 'array' or 'numpy' [default: `default_backend()`]
+    - `compact`: whether compact mode is used
+
+    """
+
+    if backend is None:
+        backend = default_backend()
+    float_size = compact and 4 or 8
+    # Two state buffers, the contributions and the reciprocal degrees
+    per_node = (graph.indptr.itemsize + graph.outdeg.itemsize +
+            4 * float_size)
+    per_edge = graph.indices.itemsize
+    if backend == 'numpy':
+        per_edge += float_size
+        if not compact:
+            intp_size = numpy.dtype(numpy.intp).itemsize
+            per_node += 2 * intp_size
+            per_edge += intp_size
+    return per_node, per_edge
+
+
+def compare_precision(graph, backend=None, tol=COMPACT_TOLERANCE):
+    """
+    Solves a graph in full and in compact mode and reports what the
+    compact mode saves and loses. Returns a dictionary with the
+    maximum absolute and relative score errors ('max_error',
+    'max_relative_error'), the L1 error ('l1_error'), how many of the
+    top 20 nodes agree ('top20_overlap'), and the bytes per node and
+    per edge of each mode ('bytes_per_node', 'bytes_per_edge',
+    'compact_bytes_per_node', 'compact_bytes_per_edge').
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `backend`: 'array' or 'numpy' [default: `default_backend()`]
+    - `tol`: the L1 residual at which both solves stop
+
+    """
+
+    small = graph.compact()
+    full = pagerank(graph, tol=tol, backend=backend).scores
+    reduced = pagerank(small, tol=tol, backend=backend,
+            compact=True).scores
+    errors = [abs(a - b) for a, b in zip(full, reduced)]
+    top = lambda scores: set(heapq.nlargest(20, xrange(len(scores)),
+            key=scores.__getitem__))
+    per_node, per_edge = footprint(graph, backend)
+    compact_node, compact_edge = footprint(small, backend, True)
+    return {
+            'max_error': max(errors or [0.]),
+            'max_relative_error': max([e / a for e, a in zip(errors, full)
+                if a] or [0.]),
+            'l1_error': sum(errors),
+            'top20_overlap': len(top(full) & top(reduced)),
+            'bytes_per_node': per_node,
+            'bytes_per_edge': per_edge,
+            'compact_bytes_per_node': compact_node,
+            'compact_bytes_per_edge': compact_edge,
+    }
+
+
+def graph_fingerprint(graph):
+    """
+    Returns the SHA-1 digest of a graph's CSR arrays, as a 20-byte
+    string, to recognise the graph a checkpoint was taken of. A graph
+    and its compact form have different fingerprints.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update(struct.pack('<qq2s', graph.n, graph.nedges,
+            graph.indptr.typecode + graph.indices.typecode))
+    digest.update(graph.indptr)
+    digest.update(graph.indices)
+    return digest.digest()
+
+
+def write_checkpoint(path, fingerprint, d, iteration, residual, scores):
+    """
+    Saves the state of a PageRank run. The file is written beside
+    `path` and renamed over it, so a run interrupted mid-write leaves
+    the previous checkpoint intact.
+
+    :Parameters:
+    - `path`: the checkpoint file
+    - `fingerprint`: the result of `graph_fingerprint`
+    - `d`: the damping factor
+    - `iteration`: the number of iterations completed
+    - `residual`: the L1 residual of the last iteration
+    - `scores`: the current scores
+
+    """
+
+    scores = array('d', scores)
+    if sys.byteorder != 'little':
+        scores.byteswap()
+    partial = path + '.tmp'
+    out = open(partial, 'wb')
+    try:
+        out.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, fingerprint,
+                len(scores), iteration, residual, d))
+        scores.tofile(out)
+        out.flush()
+        os.fsync(out.fileno())
+    finally:
+        out.close()
+    # os.rename does not replace an existing file on Windows
+    if sys.platform == 'win32' and os.path.exists(path):
+        os.remove(path)
+    os.rename(partial, path)
+
+
+def read_checkpoint(path, fingerprint, d):
+    """
+    Loads a checkpoint written by `write_checkpoint` and returns the
+    triple `(iteration, residual, scores)`, or None if there is no
+    checkpoint, or it was taken of a different graph or damping
+    factor, or it is truncated.
+
+    :Parameters:
+    - `path`: the checkpoint file
+    - `fingerprint`: the result of `graph_fingerprint` for this graph
+    - `d`: the damping factor of this run
+
+    """
+
+    if not os.path.exists(path):
+        return None
+    infile = open(path, 'rb')
+    try:
+        header = infile.read(CHECKPOINT_HEADER.size)
+        if len(header) != CHECKPOINT_HEADER.size:
+            return None
+        magic, saved, n, iteration, residual, saved_d = \
+                CHECKPOINT_HEADER.unpack(header)
+        if magic != CHECKPOINT_MAGIC or saved != fingerprint or \
+                saved_d != d:
+            return None
+        scores = array('d')
+        try:
+            scores.fromfile(infile, n)
+        except EOFError:
+            return None
+    finally:
+        infile.close()
+    if sys.byteorder != 'little':
+        scores.byteswap()
+    return iteration, residual, scores
+
+
+def checkpointed_pagerank(
+        graph,
+        path,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        backend=None,
+        interval=CHECKPOINT_INTERVAL,
+        compact=False
+        ):
+    """
+    Computes PageRank like `pagerank`, saving the scores and iteration
+    count to `path` at most every `interval` seconds, and returns a
+    `PageRankResult`. If `path` holds a checkpoint of the same graph
+    and damping factor, the run resumes from it; `max_iter` counts the
+    iterations done before the restart.
+
+    The engine is run in slices sized from the measured time per
+    iteration, so the interval is kept without checking the clock in
+    the inner loop. The last state is saved on completion too, so
+    rerunning a finished solve returns at once; delete the file to
+    start afresh.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `path`: the checkpoint file
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `backend`: the name of an engine in `BACKENDS`
+    - `interval`: seconds between checkpoints
+    - `compact`: whether to use float32 vectors (see `pagerank`)
+
+    """
+
+    fingerprint = graph_fingerprint(graph)
+    saved = read_checkpoint(path, fingerprint, d)
+    if saved is None:
+        iteration, residual, scores = 0, float('inf'), None
+    else:
+        iteration, residual, scores = saved
+        scores = scores.tolist()
+    last_saved = timeit.default_timer()
+    per_iteration = None
+    while iteration < max_iter and residual >= tol:
+        if per_iteration is None:
+            # Time one iteration before committing to a longer slice
+            steps = 1
+        else:
+            remaining = interval - (timeit.default_timer() - last_saved)
+            steps = max(1, int(remaining / per_iteration))
+        steps = min(steps, max_iter - iteration)
+        started = timeit.default_timer()
+        result = pagerank(graph, d, tol, steps, backend, scores, compact)
+        if result.iterations:
+            per_iteration = ((timeit.default_timer() - started) /
+                    result.iterations)
+        iteration += result.iterations
+        residual = result.residual
+        scores = result.scores
+        if timeit.default_timer() - last_saved >= interval:
+            write_checkpoint(path, fingerprint, d, iteration, residual,
+                    scores)
+            last_saved = timeit.default_timer()
+        if not result.iterations:
+            break
+    if scores is None:
+        return pagerank(graph, d, tol, max_iter, backend, None, compact)
+    write_checkpoint(path, fingerprint, d, iteration, residual, scores)
+    return PageRankResult(scores, iteration, residual)
+
+
+def update_pagerank(
+        graph,
+        previous,
+        added=(),
+        removed=(),
+        removed_nodes=(),
+        added_nodes=(),
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        backend=None
+        ):
+    """
+    Re-ranks a graph after a small change, resuming from the previous
+    solution rather than the uniform vector. Returns the pair
+    `(new_graph, result)`.
+
+    Edges are given as `(source, destination)` label pairs (see
+    `CSRGraph.apply_delta`). Nodes are matched to their previous scores
+    by label; new nodes start at 1/N.
+
+    :Parameters:
+    - `graph`: the `CSRGraph` that was ranked
+    - `previous`: its `PageRankResult` or list of scores
+    - `added`: edges to add; unknown labels become new nodes
+    - `removed`: edges to remove
+    - `removed_nodes`: labels of nodes to remove with their edges
+    - `added_nodes`: labels of nodes to add, e.g. members who follow
+      no one and have no followers yet
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `backend`: the name of an engine in `BACKENDS`
+
+    """
+
+    if isinstance(previous, PageRankResult):
+        previous = previous.scores
+    if len(previous) != graph.n:
+        raise ValueError("previous must have one score per node")
+    new_graph = graph.apply_delta(added, removed, removed_nodes,
+            added_nodes)
+    old_index = dict((label, i) for i, label in enumerate(graph.labels))
+    start = None
+    if new_graph.n:
+        fresh = 1. / new_graph.n
+        start = [fresh] * new_graph.n
+        for i, label in enumerate(new_graph.labels):
+            if label in old_index:
+                start[i] = previous[old_index[label]]
+    result = pagerank(new_graph, d, tol, max_iter, backend, start)
+    return new_graph, result
+
+
+def snapshot_pagerank(
+        snapshots,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        backend=None
+        ):
+    """
+    Ranks an ordered series of snapshots of a follow graph, e.g. one per
+    week, solving each from the scores of the one before. Returns a
+    list with one `(graph, result)` pair per snapshot, in order.
+
+    Each snapshot is an iterable of `(source, destination)` label pairs,
+    or a dictionary mapping each nickname to the nicknames it follows,
+    whose keys are then nodes even without any follows. Labels are
+    numbered once, in a node index shared by the whole series, and each
+    snapshot's graph holds the nodes present in it in index order, so
+    a node's previous score is found without a per-snapshot label map.
+    Nodes new to a snapshot start at 1/N.
+
+    Power iteration shrinks the error geometrically, so a warm start
+    saves iterations in proportion to the log of how close the previous
+    scores already are: an unchanged snapshot takes one iteration, but
+    churn across many nodes still needs most of a cold solve's.
+
+    :Parameters:
+    - `snapshots`: an iterable of edge iterables or follow dictionaries
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations per snapshot
+    - `backend`: the name of an engine in `BACKENDS`
+
+    """
+
+    index = {}
+    labels = []
+    # The latest score of every node in the index
+    last = array('d')
+
+    def add_node(label):
+        index[label] = len(labels)
+        labels.append(label)
+        last.append(0.)
+        return index[label]
+
+    get = index.get
+    results = []
+    for snapshot in snapshots:
+        present = set()
+        if isinstance(snapshot, dict):
+            for label in snapshot:
+                i = get(label)
+                if i is None:
+                    i = add_node(label)
+                present.add(i)
+            snapshot = [(follower, followee)
+                    for follower, followees in snapshot.items()
+                    for followee in followees]
+        sources = array(INDEX_TYPECODE)
+        destinations = array(INDEX_TYPECODE)
+        for src, dst in snapshot:
+            i = get(src)
+            if i is None:
+                i = add_node(src)
+            j = get(dst)
+            if j is None:
+                j = add_node(dst)
+            sources.append(i)
+            destinations.append(j)
+        present.update(sources)
+        present.update(destinations)
+        nodes = sorted(present)
+        edges = zip(sources, destinations)
+        if len(nodes) < len(labels):
+            # Renumber into this snapshot's own nodes
+            position = dict((i, local) for local, i in enumerate(nodes))
+            edges = [(position[src], position[dst]) for src, dst in edges]
+        graph = CSRGraph.from_edges(len(nodes), edges,
+                [labels[i] for i in nodes])
+        start = None
+        if nodes and results:
+            fresh = 1. / len(nodes)
+            start = [last[i] or fresh for i in nodes]
+        result = pagerank(graph, d, tol, max_iter, backend, start)
+        for local, i in enumerate(nodes):
+            last[i] = result.scores[local]
+        results.append((graph, result))
+    return results
+
+
+def _block_diagonal(graphs):
+    """
+    Stacks the NumPy arrays of several graphs into one block-diagonal
+    system, in the form used by `_numpy_spmv`, with the extra entries
+    'block' (the block of each node), 'starts' (the first node of each
+    block), 'sizes' and 'linked' (a mask of non-dangling nodes).
+
+    :Parameters:
+    - `graphs`: a list of non-empty `CSRGraph` instances
+
+    """
+
+    parts = [_numpy_arrays(graph) for graph in graphs]
+    sizes = numpy.array([graph.n for graph in graphs], dtype=numpy.intp)
+    starts = numpy.zeros(len(graphs), dtype=numpy.intp)
+    numpy.cumsum(sizes[:-1], out=starts[1:])
+    edge_counts = [len(part['indices']) for part in parts]
+    edge_starts = numpy.zeros(len(graphs), dtype=numpy.intp)
+    numpy.cumsum(edge_counts[:-1], out=edge_starts[1:])
+    indices = numpy.concatenate([part['indices'] + start
+            for part, start in zip(parts, starts)])
+    rows = numpy.concatenate([part['rows'] + start
+            for part, start in zip(parts, starts)])
+    offsets = numpy.concatenate([part['offsets'] + start
+            for part, start in zip(parts, edge_starts)])
+    inv_outdeg = numpy.concatenate([part['inv_outdeg'] for part in parts])
+    return {
+            'indices': indices.astype(numpy.intp),
+            'rows': rows.astype(numpy.intp),
+            'offsets': offsets.astype(numpy.intp),
+            'inv_outdeg': inv_outdeg,
+            'linked': inv_outdeg > 0,
+            'block': numpy.repeat(numpy.arange(len(graphs)), sizes),
+            'starts': starts,
+            'sizes': sizes,
+    }
+
+
+def multi_pagerank(
+        graphs,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS
+        ):
+    """
+    Ranks many independent graphs, e.g. one per room, and returns a
+    list with one `PageRankResult` per graph, in order.
+
+    With NumPy the graphs are stacked into one block-diagonal system
+    and iterated together, so the per-iteration overhead is paid once
+    rather than once per room. Teleports and dangling rank stay within
+    each block. A room leaves the active set as soon as its own
+    residual drops below `tol`, and the system is restacked from the
+    rooms still running. Without NumPy each graph is solved with the
+    array engine.
+
+    :Parameters:
+    - `graphs`: a sequence of `CSRGraph` instances
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which each graph stops
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    graphs = list(graphs)
+    results = [None] * len(graphs)
+    active = []
+    for position, graph in enumerate(graphs):
+        if not graph.n:
+            results[position] = PageRankResult([], 0, 0.)
+        else:
+            active.append(position)
+    if numpy is None:
+        for position in active:
+            results[position] = array_pagerank(graphs[position], d, tol,
+                    max_iter)
+        return results
+    if not active:
+        return results
+    if max_iter < 1:
+        # As with `array_pagerank`, no iterations leave the start vector
+        for position in active:
+            n = graphs[position].n
+            results[position] = PageRankResult([1. / n] * n, 0,
+                    float('inf'))
+        return results
+
+    system = _block_diagonal([graphs[position] for position in active])
+    state = 1. / system['sizes'][system['block']]
+    iteration = 0
+    while active:
+        iteration += 1
+        block = system['block']
+        starts = system['starts']
+        newstate = _numpy_spmv(system, state * system['inv_outdeg'])
+        newstate *= d
+        dangling_sums = numpy.add.reduceat(
+                numpy.where(system['linked'], 0., state), starts)
+        newstate += (((1. - d) + d * dangling_sums) / system['sizes'])[block]
+        residuals = numpy.add.reduceat(numpy.abs(newstate - state), starts)
+        state = newstate
+        done = residuals < tol
+        if iteration >= max_iter:
+            done[:] = True
+        if not done.any():
+            continue
+        for b in numpy.flatnonzero(done):
+            start = starts[b]
+            results[active[b]] = PageRankResult(
+                    state[start:start + system['sizes'][b]].tolist(),
+                    iteration, float(residuals[b]))
+        keep = ~done[block]
+        active = [position for position, finished in zip(active, done)
+                if not finished]
+        if active:
+            system = _block_diagonal([graphs[position]
+                    for position in active])
+            state = state[keep]
+    return results
+
+
+def teleport_vector(n, nodes):
+    """
+    Returns a personalization vector of length `n` that teleports
+    uniformly onto the given nodes, e.g. a single member.
+
+    :Parameters:
+    - `n`: the number of nodes
+    - `nodes`: node indices to teleport to
+
+    """
+
+    nodes = list(nodes)
+    if not nodes:
+        raise ValueError("at least one node must be given")
+    vector = [0.] * n
+    for i in nodes:
+        vector[i] += 1. / len(nodes)
+    return vector
+
+
+def _numpy_personalized(graph, teleports, d, tol, max_iter):
+    """
+    Solves one block of personalized PageRank problems together, with
+    one column per teleport vector. Columns drop out of the iteration
+    as they converge.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `teleports`: an N x B array of normalized teleport vectors
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+
+    """
+
+    arrays = _numpy_arrays(graph)
+    inv_outdeg = arrays['inv_outdeg'][:, numpy.newaxis]
+    dangling = arrays['dangling']
+    if max_iter < 1:
+        # As with the array engine, no iterations leave the start vectors
+        return [PageRankResult(teleports[:, column].tolist(), 0,
+                float('inf')) for column in range(teleports.shape[1])]
+    results = [None] * teleports.shape[1]
+    active = numpy.arange(teleports.shape[1])
+    state = teleports.copy()
+    iteration = 0
+    while len(active) and iteration < max_iter:
+        iteration += 1
+        newstate = _numpy_spmv(arrays, state * inv_outdeg)
+        newstate *= d
+        jump = (1. - d) + d * state[dangling].sum(axis=0)
+        newstate += teleports * jump
+        residuals = numpy.abs(newstate - state).sum(axis=0)
         state = newstate
-        print state
+        done = residuals < tol
+        if iteration >= max_iter:
+            done[:] = True
+        for column in numpy.flatnonzero(done):
+            results[active[column]] = PageRankResult(
+                    state[:, column].tolist(), iteration,
+                    float(residuals[column]))
+        if done.any():
+            keep = ~done
+            active = active[keep]
+            state = state[:, keep]
+            teleports = teleports[:, keep]
+    return results
+
+
+def personalized_pagerank(
+        graph,
+        teleports,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        block_size=PERSONALIZATION_BLOCK
+        ):
+    """
+    Solves personalized PageRank for many teleport vectors and returns
+    a list with one `PageRankResult` per vector, in order. Rank held by
+    dangling nodes follows each vector's teleport distribution.
+
+    With NumPy, up to `block_size` vectors are solved together by
+    sparse-matrix x dense-matrix products, so working memory grows as
+    O((N + E) * block_size). Without NumPy the vectors are solved one
+    at a time with the array engine.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `teleports`: a sequence of length-N teleport vectors (see
+        `teleport_vector`); each is normalized to sum to one
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `block_size`: the number of vectors solved together
+
+    """
+
+    n = graph.n
+    if block_size < 1:
+        raise ValueError("block_size must be a positive integer")
+    vectors = []
+    for teleport in teleports:
+        if len(teleport) != n:
+            raise ValueError("teleport vectors must have one entry per"
+                    " node")
+        total = float(sum(teleport))
+        if total <= 0:
+            raise ValueError("teleport vectors must have positive mass")
+        vectors.append([value / total for value in teleport])
+    if not n:
+        return [PageRankResult([], 0, 0.) for teleport in vectors]
+
+    results = []
+    if numpy is not None:
+        for start in range(0, len(vectors), block_size):
+            block = numpy.array(vectors[start:start + block_size]).T
+            results.extend(_numpy_personalized(graph, block, d, tol,
+                    max_iter))
+        return results
+
+    inv_outdeg = _array_inv_outdeg(graph)
+    newstate = array('d', [0.]) * n
+    contrib = array('d', [0.]) * n
+    for vector in vectors:
+        teleport = array('d', vector)
+        state = array('d', vector)
+        iteration = 0
+        residual = float('inf')
+        while iteration < max_iter:
+            iteration += 1
+            residual = _array_step(graph, inv_outdeg, d, state, newstate,
+                    contrib, teleport)
+            state, newstate = newstate, state
+            if residual < tol:
+                break
+        results.append(PageRankResult(state.tolist(), iteration,
+                residual))
+    return results
+
+
+def local_pagerank(graph, seed, d=DAMPING, epsilon=LOCAL_EPSILON):
+    """
+    Approximates the PageRank personalized on a single node by
+    residual pushes (Andersen, Chung and Lang, 2006). Only nodes whose
+    residual exceeds `epsilon` per out-link are touched, so the work is
+    O(1 / (epsilon * (1 - d))) however large the graph is.
+
+    Returns the pair `(scores, residuals)` of dictionaries keyed by
+    node index. Each score undershoots the exact value by no more than
+    the residual mass left behind, which is below `epsilon` times the
+    out-degree at every node.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `seed`: the index of the node to personalize on
+    - `d`: the damping factor
+    - `epsilon`: the residual per out-link at which to stop pushing
+
+    """
+
+    if not 0 <= seed < graph.n:
+        raise ValueError("seed %s is out of range" % seed)
+    out_indptr, out_indices = graph.out_links()
+    outdeg = graph.outdeg
+    scores = {}
+    residuals = {seed: 1.}
+    queue = deque([seed])
+    queued = set([seed])
+    while queue:
+        u = queue.popleft()
+        queued.discard(u)
+        mass = residuals.pop(u)
+        scores[u] = scores.get(u, 0.) + (1. - d) * mass
+        degree = outdeg[u]
+        if degree:
+            share = d * mass / degree
+            targets = xrange(out_indptr[u], out_indptr[u + 1])
+        else:
+            # A dangling node teleports straight back to the seed
+            share = d * mass
+            targets = [None]
+        for k in targets:
+            if k is None:
+                v = seed
+            else:
+                v = out_indices[k]
+            residual = residuals.get(v, 0.) + share
+            residuals[v] = residual
+            if v not in queued and residual > epsilon * max(outdeg[v], 1):
+                queue.append(v)
+                queued.add(v)
+    return scores, residuals
+
+
+def montecarlo_pagerank(
+        graph,
+        k=20,
+        d=DAMPING,
+        walks_per_round=WALKS_PER_ROUND,
+        stable_rounds=STABLE_ROUNDS,
+        max_rounds=MAX_ITERATIONS,
+        z=1.96,
+        seed=None
+        ):
+    """
+    Estimates the top `k` nodes by PageRank from random-walk visit
+    counts, and returns a `MonteCarloResult`.
+
+    Each walk starts at a uniformly random node and follows a random
+    out-link with probability `d` at every step, ending otherwise;
+    dangling nodes jump to a random node. A node's score is its share
+    of all visits. Rounds of `walks_per_round` walks run until the
+    top-k set has stayed the same for `stable_rounds` rounds in a row,
+    so the cost depends on how clear the leaders are rather than on
+    the size of the graph.
+
+    The bounds treat each node's visit count as Poisson, giving an
+    approximate `z`-sigma interval on its score.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `k`: the number of leaders wanted
+    - `d`: the damping factor
+    - `walks_per_round`: walks run between checks of the top-k set
+    - `stable_rounds`: rounds the top-k set must be unchanged to stop
+    - `max_rounds`: the maximum number of rounds
+    - `z`: the width of the bounds in standard deviations
+    - `seed`: a seed for the random number generator, for repeatable
+        estimates
+
+    """
+
+    n = graph.n
+    if not n:
+        return MonteCarloResult([], 0, 0, 0)
+    rng = random.Random(seed)
+    out_indptr, out_indices = graph.out_links()
+    outdeg = graph.outdeg
+    counts = {}
+    steps = 0
+    walks = 0
+    rounds = 0
+    stable = 0
+    leaders = None
+    top = []
+    while rounds < max_rounds and stable < stable_rounds:
+        rounds += 1
+        for w in xrange(walks_per_round):
+            node = rng.randrange(n)
+            while True:
+                counts[node] = counts.get(node, 0) + 1
+                steps += 1
+                if rng.random() >= d:
+                    break
+                degree = outdeg[node]
+                if degree:
+                    node = out_indices[out_indptr[node] +
+                            rng.randrange(degree)]
+                else:
+                    node = rng.randrange(n)
+        walks += walks_per_round
+        top = heapq.nlargest(k, counts, key=counts.__getitem__)
+        if leaders is not None and set(top) == leaders:
+            stable += 1
+        else:
+            stable = 0
+        leaders = set(top)
+    ranking = []
+    for node in top:
+        count = counts[node]
+        spread = z * math.sqrt(count)
+        ranking.append((node, float(count) / steps,
+                max(count - spread, 0.) / steps,
+                (count + spread) / steps))
+    return MonteCarloResult(ranking, rounds, walks, steps)
+
+
+def write_edge_file(graph, path):
+    """
+    Writes a graph's edges to a binary edge file for `mmap_pagerank`.
+    See the edgefile script for converting text edge lists too large
+    to load as a graph.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `path`: the file to write
+
+    """
+
+    out = open(path, 'wb')
+    try:
+        out.write(EDGE_FILE_HEADER.pack(EDGE_FILE_MAGIC, graph.n,
+                graph.nedges))
+        chunk = array('i')
+        for src, dst in graph.edges():
+            chunk.append(src)
+            chunk.append(dst)
+            if len(chunk) >= 2 * EDGE_CHUNK:
+                _write_edge_chunk(out, chunk)
+                chunk = array('i')
+        _write_edge_chunk(out, chunk)
+    finally:
+        out.close()
+
+
+def _write_edge_chunk(out, chunk):
+    """
+    Writes an int32 array to a file in little-endian order.
+
+    :Parameters:
+    - `out`: a file open for binary writing
+    - `chunk`: an `array('i')`
+
+    """
+
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    out.write(chunk.tostring())
+
+
+def read_edge_file_header(buf):
+    """
+    Returns the `(n, nedges)` pair from the header of a binary edge
+    file, raising a `ValueError` if the header is malformed.
+
+    :Parameters:
+    - `buf`: the file contents, or at least the header
+
+    """
+
+    if len(buf) < EDGE_FILE_HEADER.size:
+        raise ValueError("edge file is too short for its header")
+    magic, n, nedges = EDGE_FILE_HEADER.unpack(buf[:EDGE_FILE_HEADER.size])
+    if magic != EDGE_FILE_MAGIC:
+        raise ValueError("not a RoomRanker edge file")
+    if len(buf) < EDGE_FILE_HEADER.size + nedges * EDGE_SIZE:
+        raise ValueError("edge file is truncated")
+    return n, nedges
+
+
+def _edge_chunks(buf, nedges, chunk_edges):
+    """
+    Yields the edges of a mapped edge file as int32 arrays holding
+    alternating sources and destinations, `chunk_edges` pairs at a
+    time.
+
+    NOTE: Returns an iterator.
+
+    :Parameters:
+    - `buf`: the mapped file
+    - `nedges`: the number of edges in the file
+    - `chunk_edges`: the number of edges per chunk
+
+    """
+
+    offset = EDGE_FILE_HEADER.size
+    end = offset + nedges * EDGE_SIZE
+    step = chunk_edges * EDGE_SIZE
+    while offset < end:
+        chunk = array('i')
+        chunk.fromstring(buf[offset:min(offset + step, end)])
+        if sys.byteorder == 'big':
+            chunk.byteswap()
+        yield chunk
+        offset += step
+
+
+def _numpy_edge_chunks(buf, nedges, chunk_edges):
+    """
+    Yields the edges of a mapped edge file as `(sources, destinations)`
+    pairs of NumPy views into the mapping, `chunk_edges` edges at a
+    time.
+
+    NOTE: Requires NumPy. Returns an iterator.
+
+    :Parameters:
+    - `buf`: the mapped file
+    - `nedges`: the number of edges in the file
+    - `chunk_edges`: the number of edges per chunk
+
+    """
+
+    offset = EDGE_FILE_HEADER.size
+    remaining = nedges
+    while remaining:
+        count = min(remaining, chunk_edges)
+        pairs = numpy.frombuffer(buf, dtype='<i4', count=2 * count,
+                offset=offset)
+        yield pairs[0::2], pairs[1::2]
+        offset += count * EDGE_SIZE
+        remaining -= count
+
+
+def mmap_pagerank(
+        path,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS,
+        start=None,
+        chunk_edges=EDGE_CHUNK
+        ):
+    """
+    Runs power iteration over a binary edge file (see
+    `write_edge_file`), mapped with `mmap` and streamed once per
+    iteration. Only O(N) score vectors are held in memory; the edges
+    stay in the page cache. Returns a `PageRankResult`.
+
+    Chunks are processed with NumPy when it is available.
+
+    :Parameters:
+    - `path`: the edge file
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores [default: uniform]
+    - `chunk_edges`: the number of edges read at a time
+
+    """
+
+    if mmap is None:
+        raise ImportError("mmap is required for mmap_pagerank.")
+    infile = open(path, 'rb')
+    try:
+        buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return _mmap_iterate(buf, d, tol, max_iter, start,
+                    chunk_edges)
+        finally:
+            buf.close()
+    finally:
+        infile.close()
+
+
+def _mmap_iterate(buf, d, tol, max_iter, start, chunk_edges):
+    """
+    Runs the iteration of `mmap_pagerank` over an open mapping.
+
+    :Parameters:
+    - `buf`: the mapped edge file
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of iterations
+    - `start`: optional initial scores
+    - `chunk_edges`: the number of edges read at a time
+
+    """
+
+    n, nedges = read_edge_file_header(buf)
+    if not n:
+        return PageRankResult([], 0, 0.)
+    use_numpy = numpy is not None
+    state = _start_vector(n, start)
+    if use_numpy:
+        outdeg = numpy.zeros(n, dtype=numpy.intp)
+        for sources, destinations in _numpy_edge_chunks(buf, nedges,
+                chunk_edges):
+            outdeg += numpy.bincount(sources, minlength=n)
+        dangling = outdeg == 0
+        inv_outdeg = numpy.zeros(n)
+        inv_outdeg[~dangling] = 1. / outdeg[~dangling]
+        del outdeg
+        state = _numpy_from_array(state).copy()
+    else:
+        outdeg = array('l', [0]) * n
+        for chunk in _edge_chunks(buf, nedges, chunk_edges):
+            for k in xrange(0, len(chunk), 2):
+                outdeg[chunk[k]] += 1
+        inv_outdeg = array('d', [0.]) * n
+        for j in xrange(n):
+            if outdeg[j]:
+                inv_outdeg[j] = 1. / outdeg[j]
+        del outdeg
+        newstate = array('d', [0.]) * n
+        contrib = array('d', [0.]) * n
+
+    iteration = 0
+    residual = float('inf')
+    while iteration < max_iter:
+        iteration += 1
+        if use_numpy:
+            contrib = state * inv_outdeg
+            newstate = numpy.zeros(n)
+            for sources, destinations in _numpy_edge_chunks(buf, nedges,
+                    chunk_edges):
+                newstate += numpy.bincount(destinations,
+                        weights=contrib[sources], minlength=n)
+            newstate *= d
+            newstate += ((1. - d) + d * state[dangling].sum()) / n
+            residual = float(numpy.abs(newstate - state).sum())
+            state = newstate
+        else:
+            dangling_sum = 0.
+            for j in xrange(n):
+                contrib[j] = state[j] * inv_outdeg[j]
+                if not inv_outdeg[j]:
+                    dangling_sum += state[j]
+                newstate[j] = 0.
+            for chunk in _edge_chunks(buf, nedges, chunk_edges):
+                for k in xrange(0, len(chunk), 2):
+                    newstate[chunk[k + 1]] += contrib[chunk[k]]
+            base = ((1. - d) + d * dangling_sum) / n
+            residual = 0.
+            for i in xrange(n):
+                value = base + d * newstate[i]
+                residual += abs(value - state[i])
+                newstate[i] = value
+            state, newstate = newstate, state
+        if residual < tol:
+            break
+    return PageRankResult(state.tolist(), iteration, residual)
+
+
+def strongly_connected_components(graph):
+    """
+    Finds the strongly connected components of a graph with an
+    iterative version of Tarjan's algorithm, so deep chains cannot hit
+    the recursion limit. Returns the pair `(components, membership)`:
+    a list of node lists in topological order, every component after
+    all components with links into it, and an array giving the
+    component index of each node.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+
+    """
+
+    n = graph.n
+    indptr = graph.indptr
+    indices = graph.indices
+    order = array('l', [-1]) * n
+    low = array('l', [0]) * n
+    membership = array('l', [-1]) * n
+    on_stack = array('b', [0]) * n
+    stack = []
+    components = []
+    counter = 0
+    # Walking in-links, Tarjan completes a component only after every
+    # component upstream of it, which is the order the solver wants.
+    for root in xrange(n):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, indptr[root])]
+        while work:
+            v, k = work[-1]
+            if k < indptr[v + 1]:
+                work[-1] = (v, k + 1)
+                w = indices[k]
+                if order[w] == -1:
+                    order[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    work.append((w, indptr[w]))
+                elif on_stack[w] and order[w] < low[v]:
+                    low[v] = order[w]
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == order[v]:
+                members = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = 0
+                    membership[w] = len(components)
+                    members.append(w)
+                    if w == v:
+                        break
+                components.append(members)
+    return components, membership
+
+
+def scc_pagerank(
+        graph,
+        d=DAMPING,
+        tol=TOLERANCE,
+        max_iter=MAX_ITERATIONS
+        ):
+    """
+    Solves PageRank one strongly connected component at a time, in
+    topological order, and returns a `PageRankResult` whose
+    `iterations` is the most any component needed.
+
+    PageRank is proportional to the solution of y = d * A * y + 1/N,
+    where A spreads each node's score over its out-links and dangling
+    nodes are dropped. Once every upstream component is solved, the
+    rank flowing into a component is fixed, so each component is
+    iterated (with in-place Gauss-Seidel sweeps) only until it has
+    converged itself. Single-node components take one step. Before
+    each sweep of a larger component, its scores are rescaled so that
+    as much rank leaks out of it as flows in, which settles its total
+    at once; the sweeps then only have to settle its shape.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `d`: the damping factor
+    - `tol`: the L1 residual at which to stop
+    - `max_iter`: the maximum number of sweeps of any one component
+
+    """
+
+    n = graph.n
+    if not n:
+        return PageRankResult([], 0, 0., 0)
+    indptr = graph.indptr
+    indices = graph.indices
+    inv_outdeg = _array_inv_outdeg(graph)
+    components, membership = strongly_connected_components(graph)
+    y = array('d', [0.]) * n
+    inflow = array('d', [0.]) * n
+    kept = array('d', [0.]) * n
+    most_iterations = 1
+    total_residual = 0.
+    relaxations = 0
+    for c, members in enumerate(components):
+        # Rank from upstream components is final by now. The same pass
+        # finds the share of each member's score that stays in the
+        # component after a step
+        for i in members:
+            total = 0.
+            for k in xrange(indptr[i], indptr[i + 1]):
+                j = indices[k]
+                if membership[j] != c:
+                    total += y[j] * inv_outdeg[j]
+                else:
+                    kept[j] += d * inv_outdeg[j]
+            inflow[i] = 1. / n + d * total
+            y[i] = inflow[i]
+            relaxations += indptr[i + 1] - indptr[i]
+        if len(members) == 1:
+            continue
+        # The total flowing in from outside
+        supply = 0.
+        for i in members:
+            supply += inflow[i]
+        # Each sweep is rescaled so the component's mass balances: as
+        # much flows in as leaks out. This fixes the component's total,
+        # which plain sweeps would approach only at rate d, much as
+        # normalizing does in `_gauss_seidel_pagerank`
+        iteration = 0
+        residual = float('inf')
+        while iteration < max_iter:
+            leak = 0.
+            for j in members:
+                leak += y[j] * (1. - kept[j])
+            scale = supply / leak
+            for j in members:
+                y[j] *= scale
+            iteration += 1
+            residual = 0.
+            mass = 0.
+            for i in members:
+                total = 0.
+                for k in xrange(indptr[i], indptr[i + 1]):
+                    j = indices[k]
+                    if membership[j] == c:
+                        total += y[j] * inv_outdeg[j]
+                value = inflow[i] + d * total
+                residual += abs(value - y[i])
+                mass += value
+                y[i] = value
+                relaxations += indptr[i + 1] - indptr[i]
+            if residual < tol * mass:
+                break
+        most_iterations = max(most_iterations, iteration)
+        total_residual += residual
+    scale = 1. / sum(y)
+    scores = [value * scale for value in y]
+    return PageRankResult(scores, most_iterations, total_residual * scale,
+            relaxations)
+
+
+def _breadth_first(graph, roots, sort_key=None):
+    """
+    Returns the nodes in breadth-first order over the undirected graph,
+    starting from each unvisited node of `roots` in turn. If given,
+    `sort_key` orders each node's newly discovered neighbors.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `roots`: candidate start nodes, covering every component
+    - `sort_key`: an optional key function for node indices
+
+    """
+
+    visited = array('b', [0]) * graph.n
+    order = []
+    for root in roots:
+        if visited[root]:
+            continue
+        visited[root] = 1
+        head = len(order)
+        order.append(root)
+        while head < len(order):
+            v = order[head]
+            head += 1
+            found = [w for w in graph.neighbors(v) if not visited[w]]
+            if sort_key is not None:
+                found.sort(key=sort_key)
+            for w in found:
+                if not visited[w]:
+                    visited[w] = 1
+                    order.append(w)
+    return order
+
+
+def node_order(graph, method='rcm'):
+    """
+    Returns a permutation of the nodes for `CSRGraph.permute` that
+    places linked nodes near each other, so the scattered reads of a
+    power iteration hit the cache more often.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `method`: 'degree' (busiest nodes first), 'bfs' (breadth-first
+        from the busiest node) or 'rcm' (reverse Cuthill-McKee)
+
+    """
+
+    n = graph.n
+    indptr = graph.indptr
+    outdeg = graph.outdeg
+    degree = array(INDEX_TYPECODE, [0]) * n
+    for i in xrange(n):
+        degree[i] = indptr[i + 1] - indptr[i] + outdeg[i]
+    if method == 'degree':
+        return sorted(xrange(n), key=lambda i: -degree[i])
+    elif method == 'bfs':
+        roots = sorted(xrange(n), key=lambda i: -degree[i])
+        return _breadth_first(graph, roots)
+    elif method == 'rcm':
+        # Cuthill-McKee starts each component from a low-degree node
+        # and visits neighbors by increasing degree
+        roots = sorted(xrange(n), key=degree.__getitem__)
+        order = _breadth_first(graph, roots, degree.__getitem__)
+        order.reverse()
+        return order
+    raise ValueError("Unknown ordering method '%s'." % method)
+
+
+def reorder(graph, method='rcm'):
+    """
+    Returns a copy of the graph with its nodes relabeled by
+    `node_order`. Scores computed on the copy can be matched to names
+    with `CSRGraph.scores_by_label`.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `method`: 'degree', 'bfs' or 'rcm'
+
+    """
+
+    return graph.permute(node_order(graph, method))
+
+
+def _time_iteration(graph, backend, iterations):
+    """
+    Returns the wall time of one iteration of a backend, averaged over
+    `iterations` iterations after a warm-up.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `backend`: the name of an engine in `BACKENDS`
+    - `iterations`: the number of iterations to time
+
+    """
+
+    pagerank(graph, tol=0., max_iter=1, backend=backend)
+    started = timeit.default_timer()
+    pagerank(graph, tol=0., max_iter=iterations, backend=backend)
+    return (timeit.default_timer() - started) / iterations
+
+
+def reorder_benchmark(graph, method='rcm', backend=None, iterations=10):
+    """
+    Measures what reordering a graph costs and what it saves. Returns
+    a dictionary with the seconds spent reordering
+    ('reorder_seconds'), the seconds per iteration before and after
+    ('iteration_seconds', 'reordered_iteration_seconds'), the speedup
+    per iteration ('speedup') and the number of iterations needed to
+    pay back the reordering ('break_even_iterations').
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+    - `method`: 'degree', 'bfs' or 'rcm'
+    - `backend`: the name of an engine in `BACKENDS`
+    - `iterations`: the number of iterations to time
+
+    """
+
+    started = timeit.default_timer()
+    reordered = reorder(graph, method)
+    reorder_seconds = timeit.default_timer() - started
+    before = _time_iteration(graph, backend, iterations)
+    after = _time_iteration(reordered, backend, iterations)
+    saved = before - after
+    if saved > 0:
+        break_even = reorder_seconds / saved
+    else:
+        break_even = None
+    return {
+            'method': method,
+            'reorder_seconds': reorder_seconds,
+            'iteration_seconds': before,
+            'reordered_iteration_seconds': after,
+            'speedup': before / after if after else None,
+            'break_even_iterations': break_even,
+    }
+
+
+def pageRank(links):
+    """
+    Returns PageRank scores for a dense link matrix. Kept for callers of
+    the original interface; see `CSRGraph.from_links`.
+
+    :Parameters:
+    - `links`: a list of lists
+
+    """
+
+    return pagerank(CSRGraph.from_links(links)).scores
+
 
 if __name__ == "__main__":
     links = [ [0, 1,1,1], [ 0,0,0,1], [0,1,0,1], [0,0,0,0]]
     links = [ [0, 0,1,0], [ 1,0,0,0], [1,1,0,1], [0,0,0,0]]
     #links = [ [0, 1,0], [ 0,1,1], [0,1,0]]
     #links = [ [1, 1,1], [ 1,1,1], [1,1,1]]
-    pageRank(links)
+    print pageRank(links)
+    graph = CSRGraph.from_edges(4, [(1, 0), (2, 0), (3, 0), (3, 1)])
+    for backend in sorted(BACKENDS):
+        if backend == 'numpy' and numpy is None:
+            continue
+        print graph, backend, pagerank(graph, backend=backend)
+    for method in ['quadratic', 'gauss-seidel']:
+        plain, accelerated = compare_acceleration(graph, method=method)
+        print "%s: %d iterations, plain: %d" % (method,
+                accelerated.iterations, plain.iterations)
+    teleports = [teleport_vector(graph.n, [i]) for i in range(graph.n)]
+    for i, result in enumerate(personalized_pagerank(graph, teleports)):
+        print "personalized on %d:" % i, result.scores
+    previous = pagerank(graph)
+    graph, result = update_pagerank(graph, previous, added=[(0, 4), (4, 3)])
+    print graph, "updated:", result
+    scores, residuals = local_pagerank(graph, 3)
+    print "local to 3:", sorted(scores.items(), key=lambda x: -x[1])
+    estimate = montecarlo_pagerank(graph, k=2, seed=0)
+    print estimate, estimate.top
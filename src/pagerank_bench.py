@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# vim: et ts=4 sw=4 smarttab
+
+"""
+Times the PageRank engines on reproducible synthetic follower graphs
+and writes the results as JSON, so runs can be compared between
+releases.
+
+"""
+
+import bisect
+import cPickle as pickle
+import optparse
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+import traceback
+
+# json is in the standard library from Python 2.6
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import pagerank
+
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_MODELS = ['barabasi-albert', 'chung-lu']
+
+
+def barabasi_albert(n, m=3, reciprocity=.1, seed=0):
+    """
+    Returns a `CSRGraph` grown by preferential attachment: each new
+    member follows `m` earlier members chosen in proportion to their
+    follower count plus one, and is followed back with probability
+    `reciprocity`.
+
+    :Parameters:
+    - `n`: the number of nodes
+    - `m`: follows made by each new member; sets the density
+    - `reciprocity`: the chance each follow is returned
+    - `seed`: the random seed
+
+    """
+
+    rng = random.Random(seed)
+    edges = []
+    # Every node appears once, plus once per follower, so sampling
+    # this list uniformly is preferential attachment
+    targets = []
+    for i in xrange(n):
+        chosen = set()
+        if targets:
+            for k in xrange(min(m, i)):
+                chosen.add(targets[rng.randrange(len(targets))])
+        for j in chosen:
+            edges.append((i, j))
+            targets.append(j)
+            if rng.random() < reciprocity:
+                edges.append((j, i))
+                targets.append(i)
+        targets.append(i)
+    return pagerank.CSRGraph.from_edges(n, edges)
+
+
+def chung_lu(n, avg_degree=4., exponent=2.5, seed=0):
+    """
+    Returns a `CSRGraph` from the Chung-Lu model: node weights follow a
+    power law with the given exponent, and about `n * avg_degree`
+    edges join endpoints drawn in proportion to their weights.
+
+    :Parameters:
+    - `n`: the number of nodes
+    - `avg_degree`: the mean out-degree; sets the density
+    - `exponent`: the power-law exponent of the degree distribution
+    - `seed`: the random seed
+
+    """
+
+    rng = random.Random(seed)
+    power = -1. / (exponent - 1.)
+    cumulative = []
+    total = 0.
+    for i in xrange(n):
+        total += (i + 1.) ** power
+        cumulative.append(total)
+    # Shuffle node IDs so popular members are not all at low indices
+    ids = range(n)
+    rng.shuffle(ids)
+    edges = []
+    for k in xrange(int(n * avg_degree)):
+        src = bisect.bisect(cumulative, rng.random() * total)
+        dst = bisect.bisect(cumulative, rng.random() * total)
+        edges.append((ids[min(src, n - 1)], ids[min(dst, n - 1)]))
+    return pagerank.CSRGraph.from_edges(n, edges)
+
+
+MODELS = {
+        'barabasi-albert': lambda n, density, seed: barabasi_albert(n,
+            max(int(round(density)), 1), seed=seed),
+        'chung-lu': lambda n, density, seed: chung_lu(n, density,
+            seed=seed),
+}
+
+
+def _write_temporary_edge_file(graph):
+    """
+    Writes a graph to a temporary edge file and returns its path.
+
+    :Parameters:
+    - `graph`: a `CSRGraph`
+
+    """
+
+    handle, path = tempfile.mkstemp(suffix='.edges')
+    os.close(handle)
+    pagerank.write_edge_file(graph, path)
+    return path
+
+
+def _solve_edge_file(path, tol):
+    """
+    Solves a temporary edge file with `pagerank.mmap_pagerank`, then
+    removes it.
+
+    :Parameters:
+    - `path`: the edge file
+    - `tol`: the L1 residual at which to stop
+
+    """
+
+    try:
+        return pagerank.mmap_pagerank(path, tol=tol)
+    finally:
+        os.remove(path)
+
+
+def _unchanged(graph):
+    return graph
+
+
+def available_solvers():
+    """
+    Returns a dictionary mapping the name of each engine usable here to
+    a `(prepare, solve)` pair: `prepare(graph)` builds the engine's
+    input, such as a compact graph or an edge file, and is timed
+    separately from `solve(input, tol)`, which returns a
+    `PageRankResult`.
+
+    """
+
+    solvers = {}
+    for name in pagerank.BACKENDS:
+        if name == 'numpy' and pagerank.numpy is None:
+            continue
+        if name == 'parallel' and pagerank.multiprocessing is None:
+            continue
+        solvers[name] = (_unchanged,
+                lambda graph, tol, name=name: pagerank.pagerank(graph,
+                tol=tol, backend=name))
+    compact = lambda graph: graph.compact()
+    solvers['array-compact'] = (compact,
+            lambda graph, tol: pagerank.pagerank(graph, tol=tol,
+            backend='array', compact=True))
+    if pagerank.numpy is not None:
+        solvers['numpy-compact'] = (compact,
+                lambda graph, tol: pagerank.pagerank(graph, tol=tol,
+                backend='numpy', compact=True))
+    solvers['quadratic'] = (_unchanged,
+            lambda graph, tol: pagerank.accelerated_pagerank(graph,
+            tol=tol))
+    solvers['scc'] = (_unchanged,
+            lambda graph, tol: pagerank.scc_pagerank(graph, tol=tol))
+    solvers['mmap'] = (_write_temporary_edge_file, _solve_edge_file)
+    return solvers
+
+
+def _peak_rss_kb(who=None):
+    """
+    Returns the peak resident set size in kilobytes of this process, or
+    of the largest of its waited-for children, or None where it cannot
+    be read.
+
+    :Parameters:
+    - `who`: `resource.RUSAGE_SELF` or `resource.RUSAGE_CHILDREN`
+        [default: `resource.RUSAGE_SELF`]
+
+    """
+
+    if resource is None:
+        return None
+    if who is None:
+        who = resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+def _run_solver(solver, graph, tol):
+    """
+    Runs one solve in this process and returns a dictionary of its
+    timings and work.
+
+    :Parameters:
+    - `solver`: a `(prepare, solve)` pair from `available_solvers()`
+    - `graph`: a `CSRGraph`
+    - `tol`: the L1 residual at which to stop
+
+    """
+
+    prepare, solve = solver
+    started = timeit.default_timer()
+    prepared = prepare(graph)
+    prepare_seconds = timeit.default_timer() - started
+    started = timeit.default_timer()
+    result = solve(prepared, tol)
+    seconds = timeit.default_timer() - started
+    if result.relaxations is not None:
+        relaxations = result.relaxations
+    else:
+        relaxations = result.iterations * graph.nedges
+    if result.visits is not None:
+        visits = result.visits
+    else:
+        visits = result.iterations * graph.n
+    return {
+            'iterations': result.iterations,
+            'residual': result.residual,
+            'prepare_seconds': prepare_seconds,
+            'seconds': seconds,
+            'relaxations': relaxations,
+            'visits': visits,
+            'edges_per_second': relaxations / seconds if seconds else None,
+    }
+
+
+def time_solver(solver, graph, tol):
+    """
+    Runs one solve and returns a dictionary of its measurements.
+
+    Where `os.fork` is available the solve runs in a child process, so
+    'peak_rss_kb' is that solve's own peak, 'rss_growth_kb' how far it
+    rose above the child's size at the fork (the graph included), and
+    'workers_peak_rss_kb' the peak of the largest worker process the
+    solve started, if any. Elsewhere the memory fields are None, as the
+    process-wide peak would only reflect the largest solve so far.
+
+    :Parameters:
+    - `solver`: a `(prepare, solve)` pair from `available_solvers()`
+    - `graph`: a `CSRGraph`
+    - `tol`: the L1 residual at which to stop
+
+    """
+
+    if not hasattr(os, 'fork'):
+        record = _run_solver(solver, graph, tol)
+        record.update({
+                'peak_rss_kb': None,
+                'rss_growth_kb': None,
+                'workers_peak_rss_kb': None,
+        })
+        return record
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if not pid:
+        # The child; it must never return into the caller's code
+        status = 1
+        try:
+            try:
+                os.close(read_end)
+                # A forked child's peak starts from its size at the fork
+                base = _peak_rss_kb()
+                record = _run_solver(solver, graph, tol)
+                peak = _peak_rss_kb()
+                record['peak_rss_kb'] = peak
+                record['rss_growth_kb'] = None
+                if peak is not None:
+                    record['rss_growth_kb'] = peak - base
+                record['workers_peak_rss_kb'] = (
+                        _peak_rss_kb(getattr(resource, 'RUSAGE_CHILDREN',
+                        None)) or None)
+                status = 0
+            except Exception:
+                record = {'error': traceback.format_exc()}
+            outfile = os.fdopen(write_end, 'wb')
+            pickle.dump(record, outfile, pickle.HIGHEST_PROTOCOL)
+            outfile.close()
+        finally:
+            os._exit(status)
+    os.close(write_end)
+    infile = os.fdopen(read_end, 'rb')
+    try:
+        data = infile.read()
+    finally:
+        infile.close()
+    os.waitpid(pid, 0)
+    if not data:
+        raise RuntimeError("The solver process exited without results.")
+    record = pickle.loads(data)
+    if 'error' in record:
+        raise RuntimeError("The solver failed:\n%s" % record['error'])
+    return record
+
+
+def run_benchmarks(
+        sizes=DEFAULT_SIZES,
+        models=DEFAULT_MODELS,
+        solvers=None,
+        density=4.,
+        tol=pagerank.TOLERANCE,
+        seed=0,
+        max_python_nodes=None,
+        log=None
+        ):
+    """
+    Benchmarks each solver on each model at each size, and returns a
+    list of result dictionaries.
+
+    :Parameters:
+    - `sizes`: numbers of nodes to generate
+    - `models`: names of graph models in `MODELS`
+    - `solvers`: names of solvers from `available_solvers()` [default:
+        all of them]
+    - `density`: follows per member
+    - `tol`: the L1 residual at which to stop
+    - `seed`: the random seed for graph generation
+    - `max_python_nodes`: skip solvers other than the NumPy ones above
+        this many nodes [default: never skip]
+    - `log`: an optional file to report progress to
+
+    """
+
+    available = available_solvers()
+    if solvers is None:
+        solvers = sorted(available)
+    for name in solvers:
+        if name not in available:
+            raise ValueError("Solver '%s' is not available." % name)
+    for model in models:
+        if model not in MODELS:
+            raise ValueError("Unknown graph model '%s'." % model)
+
+    records = []
+    for model in models:
+        for n in sizes:
+            started = timeit.default_timer()
+            graph = MODELS[model](n, density, seed)
+            build_seconds = timeit.default_timer() - started
+            for name in solvers:
+                if (max_python_nodes is not None and n > max_python_nodes
+                        and not name.startswith('numpy')):
+                    continue
+                record = {
+                        'model': model,
+                        'nodes': graph.n,
+                        'edges': graph.nedges,
+                        'density': density,
+                        'seed': seed,
+                        'build_seconds': build_seconds,
+                        'solver': name,
+                        'tol': tol,
+                }
+                record.update(time_solver(available[name], graph, tol))
+                records.append(record)
+                if log is not None:
+                    log.write("%-16s %8d nodes  %-14s %4d iterations"
+                            "  %9.3fs\n" % (model, graph.n, name,
+                            record['iterations'], record['seconds']))
+    return records
+
+
+def make_cli_parser():
+
+    usage = "\n\n".join([
+        "python %prog [OPTIONS]",
+        __doc__,
+        """\
+For example, to benchmark the NumPy engines up to a million members:
+
+    python %prog -s 100,10000,1000000 -b numpy,numpy-compact\
+"""])
+
+    cli_parser = optparse.OptionParser(usage)
+    cli_parser.add_option('-s', '--sizes',
+        default=','.join([str(n) for n in DEFAULT_SIZES]),
+        help="Comma-separated numbers of nodes [default: %default]"
+    )
+    cli_parser.add_option('-m', '--models',
+        default=','.join(DEFAULT_MODELS),
+        help="Comma-separated graph models [default: %default]"
+    )
+    cli_parser.add_option('-b', '--backends',
+        help="Comma-separated solvers to time [default: all available]"
+    )
+    cli_parser.add_option('-d', '--density', type='float', default=4.,
+        help="Follows per member [default: %default]"
+    )
+    cli_parser.add_option('-t', '--tolerance', type='float',
+        default=pagerank.TOLERANCE,
+        help="L1 residual at which to stop [default: %default]"
+    )
+    cli_parser.add_option('--seed', type='int', default=0,
+        help="Random seed for graph generation [default: %default]"
+    )
+    cli_parser.add_option('--max-python-nodes', type='int',
+        default=100000,
+        help="Only run the NumPy solvers on larger graphs"
+        " [default: %default]"
+    )
+    cli_parser.add_option('-o', '--output',
+        help="Write the JSON results to this file [default: stdout]"
+    )
+
+    return cli_parser
+
+
+def main(argv):
+    cli_parser = make_cli_parser()
+    opts, args = cli_parser.parse_args(argv)
+    if args:
+        cli_parser.error("No arguments are expected")
+    try:
+        sizes = [int(n) for n in opts.sizes.split(',')]
+    except ValueError:
+        cli_parser.error("Sizes must be integers")
+    solvers = None
+    if opts.backends:
+        solvers = opts.backends.split(',')
+    try:
+        records = run_benchmarks(sizes, opts.models.split(','), solvers,
+                opts.density, opts.tolerance, opts.seed,
+                opts.max_python_nodes, sys.stderr)
+    except ValueError, error:
+        cli_parser.error(str(error))
+    report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': getattr(pagerank.numpy, '__version__', None),
+            'results': records,
+    }
+    if opts.output:
+        outfile = open(opts.output, 'w')
+        try:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+        finally:
+            outfile.close()
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
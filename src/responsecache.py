@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# vim: et ts=4 sw=4 smarttab
+
+"""
+A persistent cache of FriendFeed API responses, kept in SQLite.
+
+`CachingURLOpener` wraps the `urlopen` function given to
+`friendfeed.FriendFeedAPI`, so repeated runs over the same room are
+answered from disk rather than the network.
+
+"""
+
+import hashlib
+import os
+import StringIO
+import threading
+import time
+import urllib
+import urlparse
+
+# sqlite3 is in the standard library from Python 2.5, but is missing on
+# App Engine
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+# json is in the standard library from Python 2.6
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+# Directory holding the cache, following the XDG convention
+CACHE_DIR = os.path.join(os.environ.get('XDG_CONFIG_HOME',
+        os.path.join(os.path.expanduser('~'), '.config')), 'roomranker')
+CACHE_PATH = os.path.join(CACHE_DIR, 'cache.sqlite')
+
+# Seconds a response stays fresh, by the first component of its API
+# path; membership changes more often than subscriptions
+DEFAULT_TTLS = {
+        'room': 60 * 60,
+        'profiles': 6 * 60 * 60,
+        'user': 6 * 60 * 60,
+}
+# Seconds a response to any other resource stays fresh
+DEFAULT_TTL = 10 * 60
+# Total size of the cached responses, in bytes, beyond which the least
+# recently used are evicted
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    uri TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+
+def normalize_uri(uri):
+    """
+    Returns a URI with its query arguments sorted, so that requests for
+    the same resource share a cache entry whatever order their
+    arguments were given in.
+
+    :Parameters:
+    - `uri`: the URI as built by `FriendFeedAPI.make_uri`
+
+    """
+
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
+    args = sorted(urlparse.parse_qsl(query, True))
+    query = '&'.join(['%s=%s' % (urllib.quote(k, ','), urllib.quote(v, ','))
+            for k, v in args])
+    return urlparse.urlunsplit((scheme, netloc.lower(), path, query, ''))
+
+
+def resource_name(uri):
+    """
+    Returns the first component of a URI's path below `/api`, such as
+    'room' or 'profiles', which selects its time to live.
+
+    :Parameters:
+    - `uri`: the URI of the request
+
+    """
+
+    parts = [part for part in urlparse.urlsplit(uri)[2].split('/')
+            if part]
+    if parts and parts[0] == 'api':
+        parts = parts[1:]
+    if parts:
+        return parts[0]
+    return ''
+
+
+class CachingURLOpener(object):
+    """
+    A replacement for `urllib2.urlopen` which answers GET requests from
+    a SQLite cache while they are fresh, and stores the responses it
+    fetches.
+
+    Entries are keyed by the normalized URI and the credentials sent,
+    so authenticated and anonymous responses are kept apart. Error
+    responses are never stored. Once the stored bodies exceed
+    `max_bytes`, the least recently used are evicted. The opener may be
+    shared between threads; only the database is serialized.
+
+    :Parameters:
+    - `path`: the SQLite database file [default: `CACHE_PATH`]
+    - `urlopen`: the function to fetch with on a miss
+    - `ttls`: a dictionary of seconds each resource stays fresh
+        [default: `DEFAULT_TTLS`]
+    - `default_ttl`: seconds other resources stay fresh
+    - `max_age`: if given, no response older than this many seconds is
+        used, whatever its resource
+    - `max_bytes`: the size of the cache beyond which entries are
+        evicted
+
+    """
+
+    def __init__(
+            self,
+            path=CACHE_PATH,
+            urlopen=None,
+            ttls=None,
+            default_ttl=DEFAULT_TTL,
+            max_age=None,
+            max_bytes=MAX_CACHE_BYTES
+            ):
+
+        if sqlite3 is None:
+            raise ImportError("sqlite3 is required for CachingURLOpener.")
+        if urlopen is None:
+            import urllib2
+            urlopen = urllib2.urlopen
+        if ttls is None:
+            ttls = DEFAULT_TTLS
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            # The cache holds authenticated responses, so only the owner
+            # may read it
+            os.makedirs(directory, 0700)
+        self.path = path
+        self.urlopen = urlopen
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+
+    def __repr__(self):
+
+        return "<CachingURLOpener %s, %d hits, %d misses>" % (self.path,
+                self.hits, self.misses)
+
+
+    def ttl(self, uri):
+        """
+        Returns the number of seconds a response for a URI stays fresh.
+
+        :Parameters:
+        - `uri`: the URI of the request
+
+        """
+
+        ttl = self.ttls.get(resource_name(uri), self.default_ttl)
+        if self.max_age is not None:
+            ttl = min(ttl, self.max_age)
+        return ttl
+
+
+    def _key(self, request):
+        """
+        Returns the cache key of a request.
+
+        :Parameters:
+        - `request`: a `urllib2.Request`
+
+        """
+
+        digest = hashlib.sha1(normalize_uri(request.get_full_url()))
+        digest.update('\0')
+        digest.update(request.get_header('Authorization') or '')
+        return digest.hexdigest()
+
+
+    def lookup(self, request):
+        """
+        Returns the cached body for a request if it is fresh, otherwise
+        None.
+
+        :Parameters:
+        - `request`: a `urllib2.Request`
+
+        """
+
+        key = self._key(request)
+        now = time.time()
+        oldest = now - self.ttl(request.get_full_url())
+        self._lock.acquire()
+        try:
+            row = self._db.execute("SELECT body FROM responses"
+                    " WHERE key = ? AND fetched >= ?",
+                    (key, oldest)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET used = ? WHERE key = ?",
+                    (now, key))
+            self._db.commit()
+        finally:
+            self._lock.release()
+        return str(row[0])
+
+
+    def store(self, request, body):
+        """
+        Stores the body of a response, then evicts the least recently
+        used entries while the cache is over its size limit.
+
+        :Parameters:
+        - `request`: a `urllib2.Request`
+        - `body`: the response body
+
+        """
+
+        now = time.time()
+        self._lock.acquire()
+        try:
+            self._db.execute("INSERT OR REPLACE INTO responses"
+                    " (key, uri, body, size, fetched, used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (self._key(request), request.get_full_url(),
+                    sqlite3.Binary(body), len(body), now, now))
+            total = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM responses"
+                        " ORDER BY used").fetchall()
+                evicted = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((key,))
+                    total -= size
+                self._db.executemany("DELETE FROM responses WHERE key = ?",
+                        evicted)
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+
+    def clear(self):
+        """
+        Removes every cached response.
+
+        """
+
+        self._lock.acquire()
+        try:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+        finally:
+            self._lock.release()
+
+
+    def close(self):
+
+        self._db.close()
+
+
+    def __call__(self, request):
+        """
+        Returns a file-like object with the response to a request, from
+        the cache when possible.
+
+        :Parameters:
+        - `request`: a `urllib2.Request`
+
+        """
+
+        if request.has_data():
+            return self.urlopen(request)
+        body = self.lookup(request)
+        self._lock.acquire()
+        try:
+            if body is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self._lock.release()
+        if body is not None:
+            return StringIO.StringIO(body)
+        stream = self.urlopen(request)
+        try:
+            body = stream.read()
+        finally:
+            stream.close()
+        if _cacheable(body):
+            self.store(request, body)
+        return StringIO.StringIO(body)
+
+
+def _cacheable(body):
+    """
+    Returns whether a response body is a JSON document other than a
+    FriendFeed error.
+
+    :Parameters:
+    - `body`: the response body
+
+    """
+
+    try:
+        response = json.loads(body.decode('utf-8'))
+    except ValueError:
+        return False
+    return not (isinstance(response, dict) and 'errorCode' in response)
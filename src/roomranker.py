@@ -12,18 +12,29 @@ __email__ = 'chris DOT lasher <AT> gmail DOT com'
 
 
 import ConfigParser
+import math
 import optparse
 import os
+import re
 import sys
-import sys
+import time
+import zlib
+import centrality
 import friendfeed
+import responsecache
+
+# json is in the standard library from Python 2.6
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 
 # Configuration file name
 RC_FILE = '.roomrankerrc'
 # By default, this program will look under the user's home directory for
 # a configuration
-#RC_PATH = os.path.expanduser('~') + os.sep + RC_FILE
+RC_PATH = os.path.expanduser('~') + os.sep + RC_FILE
 
 # The configuration file should be a file containing one section with
 # two variables: username and password. For example, it should look
@@ -35,6 +46,20 @@ RC_FILE = '.roomrankerrc'
 
 USER_SECTION = 'User'
 
+# FriendFeed nicknames are made of letters, digits, hyphens and
+# underscores
+NICKNAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Number of bulk profile requests made at once
+DEFAULT_THREADS = 4
+
+# Directory holding the follow graph of each room from its last run
+SNAPSHOT_DIR = os.path.join(responsecache.CACHE_DIR, 'snapshots')
+SNAPSHOT_VERSION = 1
+# Fraction of a room's known members refetched on each run, those
+# checked longest ago first, so stale follows are eventually refreshed
+REFRESH_FRACTION = .1
+
 
 class UserInfoError(Exception):
     """
@@ -46,15 +71,25 @@ class UserInfoError(Exception):
     pass
 
 
+class NicknameError(ValueError):
+    """
+    Error raised when a room or user nickname is malformed.
+
+    """
+
+    pass
+
+
 def make_cli_parser():
 
     usage = "\n\n".join([
         """\
-python %prog [OPTIONS] ROOM
+python %prog [OPTIONS] ROOM [ROOM ...]
 
 ARGUMENTS:
-    ROOM: the nickname of the room to analyze (e.g., friendfeed-api for
-        the "FriendFeed API" room)\
+    ROOM: the nickname of a room to analyze (e.g., friendfeed-api for
+        the "FriendFeed API" room); rooms may also be listed in a file
+        with --rooms-file\
 """,
         __doc__,
         """\
@@ -78,6 +113,44 @@ options and details.
     cli_parser.add_option('-p', '--password',
         help="Specify a password directly"
     )
+    cli_parser.add_option('-r', '--rooms-file',
+        help="Also rank the rooms listed in this file, one per line"
+    )
+    cli_parser.add_option('-t', '--threads', type='int',
+        default=DEFAULT_THREADS,
+        help="Number of profile requests to make at once"
+        " [default: %default]"
+    )
+    cli_parser.add_option('--no-cache', dest='cache', action='store_false',
+        default=True,
+        help="Fetch everything afresh without using the response cache"
+        " at %s" % responsecache.CACHE_PATH
+    )
+    cli_parser.add_option('--max-age', type='float',
+        help="Ignore cached responses older than this many seconds"
+        " [default: an hour for rooms, six for profiles]"
+    )
+    cli_parser.add_option('--snapshot-dir', default=SNAPSHOT_DIR,
+        help="Keep each room's follow graph here between runs, to"
+        " only fetch what changed [default: %default]"
+    )
+    cli_parser.add_option('--full', action='store_true', default=False,
+        help="Fetch every member afresh rather than starting from the"
+        " last snapshot"
+    )
+    cli_parser.add_option('--refresh', type='float',
+        default=REFRESH_FRACTION,
+        help="Fraction of known members to refetch on each run"
+        " [default: %default]"
+    )
+    cli_parser.add_option('-k', '--top', type='int',
+        help="Only show this many of the top-ranked members"
+    )
+    cli_parser.add_option('-e', '--engine', default='indegree',
+        choices=sorted(centrality.ENGINES),
+        help="Ranking engine: %s [default: %%default]" % (
+            ', '.join(sorted(centrality.ENGINES)))
+    )
 
     return cli_parser
 
@@ -104,6 +177,7 @@ def get_username_and_password(cli_opts):
     password = cli_opts.password
     if not (username and password):
         config_file_path = cli_opts.config
+        cfg_username, cfg_password = None, None
         if os.path.isfile(config_file_path):
             cfg_username, cfg_password = \
                     get_config_username_and_password(config_file_path)
@@ -116,34 +190,470 @@ def get_username_and_password(cli_opts):
     return username, password
 
 
-def get_api(username, password):
+def get_api(username, password, urlopen=None):
+    kwargs = {}
+    if urlopen is not None:
+        kwargs['urlopen'] = urlopen
     if (username and password):
-        api = friendfeed.FriendFeedAPI(username, password)
+        api = friendfeed.FriendFeedAPI(username, password, **kwargs)
     else:
         print "Not enough user information. Running unauthenticated."
-        api = friendfeed.FriendFeedAPI()
+        api = friendfeed.FriendFeedAPI(**kwargs)
 
     return api
 
-def generate_rankings(users):
-    sortee = [ (len(v), k) for k,v in users.items() ]
-    sortee.sort()
-    sortee.reverse()
-    return [ (k,v) for v,k in sortee ]
+def validate_nickname(nickname):
+    """
+    Raises a `NicknameError` if a nickname could not name a FriendFeed
+    user or room.
+
+    :Parameters:
+    - `nickname`: the nickname to check
+
+    """
+
+    if not NICKNAME_PATTERN.match(nickname):
+        raise NicknameError("'%s' is not a valid nickname" % nickname)
+
+
+def read_rooms_file(path):
+    """
+    Returns the room nicknames listed in a file, one per line. Blank
+    lines and lines starting with '#' are skipped.
+
+    :Parameters:
+    - `path`: the path to the file
+
+    """
+
+    rooms = []
+    rooms_file = open(path)
+    try:
+        for line in rooms_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                rooms.append(line)
+    finally:
+        rooms_file.close()
+    return rooms
+
+
+def snapshot_path(room, directory=SNAPSHOT_DIR):
+    """
+    Returns the path of the snapshot file of a room.
+
+    :Parameters:
+    - `room`: the nickname of the room
+    - `directory`: the directory holding snapshots
+
+    """
+
+    return os.path.join(directory, '%s.snapshot' % room)
+
+
+def load_snapshot(path):
+    """
+    Reads a room snapshot written by `save_snapshot` and returns it as
+    a dictionary with the keys 'room', 'taken', 'follows' (each known
+    member's nickname -> the nicknames they follow) and 'checked'
+    (each known member's nickname -> when their profile was fetched),
+    or None if there is no readable snapshot.
+
+    :Parameters:
+    - `path`: the snapshot file
+
+    """
+
+    if not os.path.exists(path):
+        return None
+    snapshot_file = open(path, 'rb')
+    try:
+        data = snapshot_file.read()
+    finally:
+        snapshot_file.close()
+    try:
+        stored = json.loads(zlib.decompress(data).decode('utf-8'))
+    except (zlib.error, ValueError):
+        return None
+    if stored.get('version') != SNAPSHOT_VERSION:
+        return None
+    nicknames = stored['nicknames']
+    follows = {}
+    checked = {}
+    for member, followees, when in zip(stored['members'],
+            stored['follows'], stored['checked']):
+        follows[nicknames[member]] = [nicknames[i] for i in followees]
+        checked[nicknames[member]] = when
+    return {
+            'room': stored['room'],
+            'taken': stored['taken'],
+            'follows': follows,
+            'checked': checked,
+    }
+
+
+def save_snapshot(path, snapshot):
+    """
+    Writes a room snapshot as zlib-compressed JSON, naming each
+    nickname once and referring to it by index elsewhere. The file is
+    written beside `path` and renamed over it.
+
+    :Parameters:
+    - `path`: the snapshot file
+    - `snapshot`: a dictionary as returned by `load_snapshot`
+
+    """
+
+    index = {}
+    nicknames = []
+
+    def number(nickname):
+        if nickname not in index:
+            index[nickname] = len(nicknames)
+            nicknames.append(nickname)
+        return index[nickname]
+
+    members = sorted(snapshot['follows'])
+    stored = {
+            'version': SNAPSHOT_VERSION,
+            'room': snapshot['room'],
+            'taken': snapshot['taken'],
+            'members': [number(member) for member in members],
+            'follows': [[number(followee)
+                for followee in snapshot['follows'][member]]
+                for member in members],
+            'checked': [snapshot['checked'][member] for member in members],
+            'nicknames': nicknames,
+    }
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    partial = path + '.tmp'
+    snapshot_file = open(partial, 'wb')
+    try:
+        snapshot_file.write(zlib.compress(json.dumps(stored,
+                separators=(',', ':')).encode('utf-8'), 9))
+        # Reach the disk before the rename, or a crash could leave an
+        # empty snapshot in place of the last good one
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    finally:
+        snapshot_file.close()
+    # os.rename does not replace an existing file on Windows
+    if sys.platform == 'win32' and os.path.exists(path):
+        os.remove(path)
+    os.rename(partial, path)
+
+
+def members_to_fetch(nicknames, snapshot, refresh=REFRESH_FRACTION):
+    """
+    Returns the members of a room whose profiles need fetching: those
+    not in the snapshot, plus the `refresh` fraction of the rest that
+    were checked longest ago. Without a snapshot, every member.
+
+    :Parameters:
+    - `nicknames`: the set of the room's current members
+    - `snapshot`: the room's snapshot, or None
+    - `refresh`: the fraction of known members to refetch
+
+    """
+
+    if snapshot is None:
+        return set(nicknames)
+    known = [nickname for nickname in nicknames
+            if nickname in snapshot['follows']]
+    fetch = set(nicknames) - set(known)
+    checked = snapshot['checked']
+    known.sort(key=lambda nickname: (checked[nickname], nickname))
+    fetch.update(known[:int(math.ceil(refresh * len(known)))])
+    return fetch
+
+
+def _crawl_members(api, rooms, threads, log, snapshots=None,
+        refresh=REFRESH_FRACTION):
+    """
+    Fetches the profiles of the members of several rooms, each distinct
+    member once, and yields a `(room, followers)` pair for each room as
+    soon as all of its members have been fetched.
+
+    Where `snapshots` holds a room's snapshot, only the members chosen
+    by `members_to_fetch` are fetched and the follows of the others are
+    taken from it; on finishing, the room's entry is replaced by its
+    updated snapshot.
+
+    The members of a request that fails are reported to `log` and
+    treated as missing, keeping their snapshot follows if they have
+    any, so one failure does not lose the rest of the crawl.
+
+    NOTE: Returns an iterator.
+
+    :Parameters:
+    - `api`: a `friendfeed.FriendFeedAPI` instance
+    - `rooms`: a list of `friendfeed.Room` instances
+    - `threads`: the number of requests to run at once
+    - `log`: an optional file to report progress and failures to
+    - `snapshots`: an optional dictionary of room nickname -> snapshot
+    - `refresh`: the fraction of known members to refetch
+
+    """
+
+    # Members are requested room by room, so the first rooms finish
+    # while the later ones are still being fetched
+    members = []
+    rooms_of = {}
+    pending = []
+    for position, room in enumerate(rooms):
+        nicknames = set([member.nickname for member in room.members])
+        snapshot = None
+        if snapshots is not None:
+            snapshot = snapshots.get(room.nickname)
+        fetch = members_to_fetch(nicknames, snapshot, refresh)
+        if log is not None and snapshot is not None:
+            log.write("%s: %d members, %d new, %d refreshed\n" % (
+                    room.nickname, len(nicknames),
+                    len(nicknames - set(snapshot['follows'])),
+                    len(fetch & set(snapshot['follows']))))
+        for nickname in fetch:
+            if nickname not in rooms_of:
+                rooms_of[nickname] = []
+                members.append(nickname)
+            rooms_of[nickname].append(position)
+        pending.append(len(fetch))
+    # The nicknames each member follows, kept only for fetched members
+    follows = {}
+    fetched = time.time()
+    done = 0
+
+    def finish(room):
+        nicknames = [member.nickname for member in room.members]
+        followers = dict((nickname, []) for nickname in nicknames)
+        snapshot = None
+        if snapshots is not None:
+            snapshot = snapshots.get(room.nickname)
+        updated = {
+                'room': room.nickname,
+                'taken': fetched,
+                'follows': {},
+                'checked': {},
+        }
+        missing = []
+        for nickname in nicknames:
+            if nickname in follows:
+                updated['follows'][nickname] = follows[nickname]
+                updated['checked'][nickname] = fetched
+            elif snapshot is not None and nickname in snapshot['follows']:
+                updated['follows'][nickname] = snapshot['follows'][nickname]
+                updated['checked'][nickname] = snapshot['checked'][nickname]
+            else:
+                missing.append(nickname)
+                continue
+            for followee in updated['follows'][nickname]:
+                if followee in followers and followee != nickname:
+                    followers[followee].append(nickname)
+        if log is not None and missing:
+            log.write("Could not fetch %s in %s\n" % (
+                    ', '.join(sorted(missing)), room.nickname))
+        if snapshots is not None:
+            snapshots[room.nickname] = updated
+        return room, followers
+
+    for position, room in enumerate(rooms):
+        if not pending[position]:
+            yield finish(room)
+    for chunk, users, error in api.iter_bulk_user_profiles(members,
+            threads):
+        # Members of a failed request are treated as missing
+        if error is not None and log is not None:
+            log.write("Could not fetch %d members: %s\n" % (len(chunk),
+                    error.__class__.__name__))
+        for user in users:
+            follows[user.nickname] = [subscription.nickname
+                    for subscription in user.subscriptions
+                    if isinstance(subscription, friendfeed.User)]
+        done += len(chunk)
+        if log is not None:
+            log.write("Fetched %d of %d members\n" % (done, len(members)))
+        for nickname in chunk:
+            for position in rooms_of.get(nickname, ()):
+                pending[position] -= 1
+                if not pending[position]:
+                    yield finish(rooms[position])
+
+
+def crawl_room(api, room, threads=DEFAULT_THREADS, log=None):
+    """
+    Fetches a room's profile, then the profiles of its members in bulk
+    `/profiles` requests, `threads` at a time, and returns the pair
+    `(room, followers)`, where `followers` maps each member's nickname
+    to the nicknames of the members following them.
+
+    Members whose profiles are not returned (e.g., private ones, or
+    those in a request that failed) are reported to `log` and kept in
+    the graph without any follows of their own.
+
+    :Parameters:
+    - `api`: a `friendfeed.FriendFeedAPI` instance
+    - `room`: the nickname of the room
+    - `threads`: the number of requests to run at once
+    - `log`: an optional file to report progress and failures to
+
+    """
+
+    room = api.get_room_profile(room)
+    return list(_crawl_members(api, [room], threads, log))[0]
+
+
+def crawl_rooms(
+        api,
+        rooms,
+        threads=DEFAULT_THREADS,
+        log=None,
+        snapshots=None,
+        refresh=REFRESH_FRACTION
+        ):
+    """
+    Crawls several rooms as `crawl_room` does, fetching the profile of
+    each member once however many of the rooms they are in, and yields
+    a `(room, followers)` pair for each room as soon as it is complete.
+    Rooms whose profiles cannot be fetched are reported to `log` and
+    skipped.
+
+    Given the snapshots of earlier runs, only new members and a
+    rotating `refresh` fraction of the others are fetched, and the
+    graph is rebuilt from the snapshot with their changes applied. Each
+    room's entry in `snapshots` is updated before the room is yielded.
+
+    NOTE: Returns an iterator.
+
+    :Parameters:
+    - `api`: a `friendfeed.FriendFeedAPI` instance
+    - `rooms`: a list of room nicknames
+    - `threads`: the number of requests to run at once
+    - `log`: an optional file to report progress and failures to
+    - `snapshots`: an optional dictionary of room nickname -> snapshot
+        (see `load_snapshot`)
+    - `refresh`: the fraction of known members to refetch
+
+    """
+
+    profiles = []
+    for nickname in rooms:
+        try:
+            profiles.append(api.get_room_profile(nickname))
+        except (IOError, friendfeed.FriendFeedException), error:
+            # urllib2's HTTPError and URLError are both IOErrors
+            if log is not None:
+                log.write("Could not fetch room %s: %s\n" % (nickname,
+                        error.__class__.__name__))
+    for room, followers in _crawl_members(api, profiles, threads, log,
+            snapshots, refresh):
+        yield room, followers
+
+
+def _count_followers(users):
+    """
+    Yields a `(nickname, count)` pair for each user, not counting
+    anyone who follows themselves.
+
+    NOTE: Returns an iterator.
+
+    :Parameters:
+    - `users`: an iterable of `(nickname, followers)` pairs
+
+    """
+
+    for nickname, followers in users:
+        count = 0
+        for follower in followers:
+            if follower != nickname:
+                count += 1
+        yield nickname, count
+
+
+def generate_rankings(users, engine='indegree', top=None):
+    """
+    Returns `(nickname, score)` pairs for the given users, best first,
+    with ties broken by nickname.
+
+    The 'indegree' engine counts followers as the pairs stream past, so
+    with `top` it needs O(k) memory however many users there are. Other
+    engines build the follow graph first.
+
+    :Parameters:
+    - `users`: a dictionary mapping each nickname to the nicknames
+      following it, or an iterable of `(nickname, followers)` pairs
+    - `engine`: the name of a ranking engine in `centrality.ENGINES`
+    - `top`: the number of users to return [default: all]
+
+    """
+
+    if isinstance(users, dict):
+        users = users.iteritems()
+    if engine == 'indegree':
+        return centrality.top_ranked(_count_followers(users), top)
+    users = dict(users)
+    graph = centrality.follower_graph(users)
+    scores = centrality.rank(graph, engine)
+    return centrality.top_ranked(((k, v) for k, v in
+            zip(graph.labels, scores) if k in users), top)
 
 
 def main(argv):
     cli_parser = make_cli_parser()
     opts, args = cli_parser.parse_args(argv)
-    if len(args) != 1:
+    rooms = list(args)
+    if opts.rooms_file:
+        try:
+            rooms.extend(read_rooms_file(opts.rooms_file))
+        except IOError, error:
+            cli_parser.error(str(error))
+    if not rooms:
         cli_parser.error("Give the nickname of a room")
-    room_nickname = args[0]
-    validate_nickname(room_nickname)
+    # Rank each room once, in the order given
+    unique = []
+    for room_nickname in rooms:
+        try:
+            validate_nickname(room_nickname)
+        except NicknameError, error:
+            cli_parser.error(str(error))
+        if room_nickname not in unique:
+            unique.append(room_nickname)
+    rooms = unique
+    if opts.top is not None and opts.top < 1:
+        cli_parser.error("--top must be at least one")
+    if opts.threads < 1:
+        cli_parser.error("At least one thread is needed")
+    if opts.max_age is not None and opts.max_age < 0:
+        cli_parser.error("The maximum age cannot be negative")
+    if not 0 <= opts.refresh <= 1:
+        cli_parser.error("--refresh must be between 0 and 1")
     username, password = get_username_and_password(opts)
-    api = get_api(username, password)
-    ## TODO: fetch room profile, then for each user, see who in the room
-    ## the user follows
-    #room = api.get_room_profile(
+    cache = None
+    if opts.cache and responsecache.sqlite3 is not None:
+        cache = responsecache.CachingURLOpener(max_age=opts.max_age)
+    api = get_api(username, password, cache)
+    snapshots = {}
+    if not opts.full:
+        for room_nickname in rooms:
+            snapshot = load_snapshot(snapshot_path(room_nickname,
+                    opts.snapshot_dir))
+            if snapshot is not None:
+                snapshots[room_nickname] = snapshot
+    crawled = crawl_rooms(api, rooms, opts.threads, sys.stderr, snapshots,
+            opts.refresh)
+    for room, followers in crawled:
+        save_snapshot(snapshot_path(room.nickname, opts.snapshot_dir),
+                snapshots[room.nickname])
+        if len(rooms) > 1:
+            print "# %s" % room.nickname
+        for rank, (nickname, score) in enumerate(
+                generate_rankings(followers, opts.engine, opts.top)):
+            print "%d\t%s\t%s" % (rank + 1, nickname, score)
+        sys.stdout.flush()
+    if cache is not None:
+        sys.stderr.write("%d responses from the cache, %d fetched\n" % (
+                cache.hits, cache.misses))
+        cache.close()
 
 
 if __name__ == '__main__':
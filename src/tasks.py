@@ -9,6 +9,7 @@ from google.appengine.ext import webapp
 #from google.appengine.ext.webapp import template
 
 from data import Job, Batch, User
+import centrality
 
 import random
 import logging
@@ -49,15 +50,15 @@ class FinishJobHandler(webapp.RequestHandler):
         job = db.get(jobid) 
         job.ready = True
         users = User.all().filter("nickname IN", job.users)
-        job.scores = [ 0. ] * len(job.users)
+        followers = {}
         for user in users:
-            name = user.nickname
-            idx = job.users.index(name)
-            #TODO: calculate scores another way
-            n = len(filter(lambda x: job.users.count(name)>0, user.friends))
-            job.scores[idx] = float(n)
+            followers[user.nickname] = user.friends
             #TODO: don't delete if caching
             user.delete()
+        # Only followers inside the room count towards a score
+        graph = centrality.follower_graph(followers, job.users)
+        job.scores = [ float(score) for score in
+                centrality.rank(graph, 'indegree') ]
         job.put() 
         
 
@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Tests for the centrality engines.
+
+"""
+
+import os
+import sys
+import unittest
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+parpath = os.path.join(MODULE_DIR, os.pardir)
+sys.path.insert(0, os.path.abspath(parpath))
+import centrality
+import pagerank
+
+# tasks runs on App Engine and is only tested where the SDK is installed
+try:
+    import tasks
+except ImportError:
+    tasks = None
+
+# Error allowed between a solver and the expected scores
+PLACES = 1.0e-8
+
+
+class CentralityTests(unittest.TestCase):
+    """Tests for the iterative engines."""
+
+    def assertScoresEqual(self, scores, expected):
+        self.assertEqual(len(scores), len(expected))
+        error = sum([abs(a - b) for a, b in zip(scores, expected)])
+        self.assert_(error < PLACES, "L1 error %g" % error)
+
+
+    def check_both(self, check):
+        """Runs `check` with NumPy, if available, and without it."""
+
+        check()
+        numpy = centrality.numpy
+        centrality.numpy = None
+        try:
+            check()
+        finally:
+            centrality.numpy = numpy
+
+
+    def test_hits_star(self):
+        """hits() on a star"""
+
+        # Four members all follow member 0
+        graph = pagerank.CSRGraph.from_edges(5, [(i, 0) for i in range(1,
+                5)])
+
+        def check():
+            result = centrality.hits(graph, tol=1e-12)
+            self.assertScoresEqual(result.authorities, [1., 0., 0., 0., 0.])
+            self.assertScoresEqual(result.hubs, [0., .25, .25, .25, .25])
+
+        self.check_both(check)
+
+
+    def test_hits_bipartite(self):
+        """hits() on a bipartite graph"""
+
+        # Members 0 and 1 follow 2, and 0 also follows 3 and 4; the hub
+        # scores are the dominant eigenvector of [[3, 1], [1, 1]]
+        graph = pagerank.CSRGraph.from_edges(5, [(0, 2), (0, 3), (0, 4),
+                (1, 2)])
+        root = 2. ** .5
+
+        def check():
+            result = centrality.hits(graph, tol=1e-12)
+            self.assertScoresEqual(result.hubs,
+                    [1. / root, 1. - 1. / root, 0., 0., 0.])
+            self.assertScoresEqual(result.authorities,
+                    [0., 0., root - 1., 1. - 1. / root, 1. - 1. / root])
+
+        self.check_both(check)
+
+
+    def test_hits_without_edges(self):
+        """hits() on graphs without edges"""
+
+        result = centrality.hits(pagerank.CSRGraph.from_edges(3, []))
+        self.assertEqual((result.hubs, result.authorities), ([0.] * 3,
+                [0.] * 3))
+        self.assertEqual(centrality.hits(
+                pagerank.CSRGraph.from_edges(0, [])).hubs, [])
+
+
+    def test_eigenvector_cycle(self):
+        """eigenvector_centrality() on a cycle"""
+
+        graph = pagerank.CSRGraph.from_edges(3, [(0, 1), (1, 2), (2, 0)])
+
+        def check():
+            result = centrality.eigenvector_centrality(graph, tol=1e-12)
+            self.assertScoresEqual(result.scores, [1. / 3] * 3)
+
+        self.check_both(check)
+
+
+    def test_eigenvector_disconnected(self):
+        """eigenvector_centrality() on a disconnected graph"""
+
+        # Members 0-2 all follow each other, 3 and 4 follow each other
+        # and 5 follows no one; the first component's larger eigenvalue
+        # takes all the score
+        edges = [(i, j) for i in range(3) for j in range(3) if i != j]
+        edges.extend([(3, 4), (4, 3)])
+        graph = pagerank.CSRGraph.from_edges(6, edges)
+
+        def check():
+            result = centrality.eigenvector_centrality(graph, tol=1e-12,
+                    max_iter=200)
+            self.assertScoresEqual(result.scores,
+                    [1. / 3] * 3 + [0.] * 3)
+            self.assert_(result.iterations < 200)
+
+        self.check_both(check)
+
+
+class RankingTests(unittest.TestCase):
+    """Tests for building graphs and ranking with several engines."""
+
+    def setUp(self):
+        self.followers = {
+                'alice': ['bob', 'carol', 'dave'],
+                'bob': ['alice'],
+                'carol': ['alice', 'bob', 'outsider'],
+                'dave': [],
+        }
+        self.members = ['alice', 'bob', 'carol', 'dave']
+
+
+    def labelled_edges(self, graph):
+        return sorted([(graph.labels[src], graph.labels[dst])
+                for src, dst in graph.edges()])
+
+
+    def test_follower_graph(self):
+        """follower_graph() with an edge from each follower"""
+
+        graph = centrality.follower_graph(self.followers)
+        self.assertEqual(graph.labels, self.members + ['outsider'])
+        self.assertEqual(self.labelled_edges(graph), [
+                ('alice', 'bob'), ('alice', 'carol'), ('bob', 'alice'),
+                ('bob', 'carol'), ('carol', 'alice'), ('dave', 'alice'),
+                ('outsider', 'carol')])
+
+
+    def test_follower_graph_members(self):
+        """follower_graph() keeping only the given members"""
+
+        members = ['dave', 'carol', 'bob', 'alice']
+        graph = centrality.follower_graph(self.followers, members)
+        self.assertEqual(graph.labels, members)
+        self.failIf('outsider' in [edge[0]
+                for edge in self.labelled_edges(graph)])
+        self.assertEqual(centrality.indegree_centrality(graph),
+                [0, 2, 1, 3])
+
+
+    def test_rank_all(self):
+        """rank_all() running each solver once"""
+
+        graph = centrality.follower_graph(self.followers, self.members)
+        calls = []
+
+        def counted_hits(graph, **options):
+            calls.append(options)
+            return centrality.hits(graph, **options)
+
+        engines = centrality.ENGINES.copy()
+        centrality.ENGINES['hub'] = (counted_hits, 'hubs')
+        centrality.ENGINES['authority'] = (counted_hits, 'authorities')
+        try:
+            scores = centrality.rank_all(graph, tol=1e-12)
+        finally:
+            centrality.ENGINES.clear()
+            centrality.ENGINES.update(engines)
+        self.assertEqual(calls, [{'tol': 1e-12}])
+        self.assertEqual(sorted(scores), sorted(engines))
+        self.assertEqual(scores['indegree'],
+                centrality.rank(graph, 'indegree'))
+        for engine in ['hub', 'authority', 'eigenvector', 'pagerank']:
+            self.assertEqual(scores[engine], centrality.rank(graph, engine,
+                    tol=1e-12))
+        self.assertRaises(ValueError, centrality.rank_all, graph,
+                ['indegree', 'bogus'])
+        self.assertRaises(ValueError, centrality.rank, graph, 'bogus')
+
+
+    def test_top_ranked(self):
+        """top_ranked() ties broken by label"""
+
+        pairs = [('d', 1), ('b', 2), ('a', 1), ('c', 2), ('e', 0)]
+        expected = [('b', 2), ('c', 2), ('a', 1), ('d', 1), ('e', 0)]
+        self.assertEqual(centrality.top_ranked(pairs), expected)
+        self.assertEqual(centrality.top_ranked(iter(pairs), 3),
+                expected[:3])
+        self.assertEqual(centrality.top_ranked(iter(pairs), 10), expected)
+
+
+    def test_rankings(self):
+        """rankings() pairing labels with scores"""
+
+        graph = centrality.follower_graph(self.followers, self.members)
+        scores = centrality.rank(graph, 'indegree')
+        self.assertEqual(centrality.rankings(graph, scores, 2),
+                [('alice', 3), ('carol', 2)])
+
+
+class FinishJobTests(unittest.TestCase):
+    """Tests for the task that scores a finished job."""
+
+    def test_finish_job(self):
+        """FinishJobHandler scoring members by in-degree"""
+
+        if tasks is None:
+            return
+        test = self
+
+        class Job(object):
+            users = ['alice', 'bob', 'carol']
+            scores = None
+
+            def put(self):
+                self.stored = list(self.scores)
+
+        class User(object):
+            def __init__(self, nickname, friends):
+                self.nickname = nickname
+                self.friends = friends
+                self.deleted = False
+
+            def delete(self):
+                self.deleted = True
+
+        class Query(object):
+            def filter(self, condition, values):
+                test.assertEqual(condition, "nickname IN")
+                return [user for user in users if user.nickname in values]
+
+        class Users(object):
+            def all(self):
+                return Query()
+
+        class Request(object):
+            def get(self, name):
+                return {'jobid': 'job-key'}[name]
+
+        job = Job()
+        users = [User('alice', ['bob', 'carol', 'outsider']),
+                User('bob', ['alice']), User('carol', [])]
+        real_db_get, real_user = tasks.db.get, tasks.User
+        tasks.db.get = lambda key: job
+        tasks.User = Users()
+        try:
+            handler = tasks.FinishJobHandler()
+            handler.request = Request()
+            handler.get()
+        finally:
+            tasks.db.get = real_db_get
+            tasks.User = real_user
+        self.assert_(job.ready)
+        self.assertEqual(job.stored, [2., 1., 0.])
+        self.failIf([user for user in users if not user.deleted])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Tests for the edge list converter.
+
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+parpath = os.path.join(MODULE_DIR, os.pardir)
+sys.path.insert(0, os.path.abspath(parpath))
+import edgefile
+import pagerank
+
+
+class ConvertTests(unittest.TestCase):
+    """Tests for convert_edge_list."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.edge_list = os.path.join(self.directory, 'graph.txt')
+        self.edge_file = os.path.join(self.directory, 'graph.edges')
+        rng = random.Random(0)
+        self.edges = [(rng.randrange(50), rng.randrange(50))
+                for k in range(300)]
+        lines = ['# source destination', '']
+        lines.extend(['%d %d' % edge for edge in self.edges])
+        self.write_edge_list(lines)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def write_edge_list(self, lines):
+        out = open(self.edge_list, 'w')
+        try:
+            out.write('\n'.join(lines) + '\n')
+        finally:
+            out.close()
+
+
+    def read_edge_file(self, path):
+        infile = open(path, 'rb')
+        try:
+            return infile.read()
+        finally:
+            infile.close()
+
+
+    def test_round_trip(self):
+        """convert_edge_list() matching write_edge_file()"""
+
+        n, nedges = edgefile.convert_edge_list(self.edge_list,
+                self.edge_file)
+        links = [(src, dst) for src, dst in self.edges if src != dst]
+        graph = pagerank.CSRGraph.from_edges(n, links)
+        self.assertEqual((n, nedges), (max(map(max, links)) + 1,
+                len(links)))
+        expected = os.path.join(self.directory, 'expected.edges')
+        pagerank.write_edge_file(graph, expected)
+        self.assertEqual(self.read_edge_file(self.edge_file),
+                self.read_edge_file(expected))
+        if pagerank.mmap is None:
+            return
+        result = pagerank.mmap_pagerank(self.edge_file, tol=1e-10,
+                chunk_edges=7)
+        error = sum([abs(a - b) for a, b in zip(result.scores,
+                pagerank.array_pagerank(graph, tol=1e-10).scores)])
+        self.assert_(error < 1e-8)
+
+
+    def test_two_passes(self):
+        """convert_edge_list() reading the edge list twice"""
+
+        passes = []
+        iter_edge_list = edgefile.iter_edge_list
+
+        def counted(path):
+            passes.append(path)
+            return iter_edge_list(path)
+
+        edgefile.iter_edge_list = counted
+        try:
+            edgefile.convert_edge_list(self.edge_list, self.edge_file)
+        finally:
+            edgefile.iter_edge_list = iter_edge_list
+        self.assertEqual(passes, [self.edge_list] * 2)
+
+
+    def test_nodes(self):
+        """convert_edge_list() with the number of nodes given"""
+
+        n, nedges = edgefile.convert_edge_list(self.edge_list,
+                self.edge_file, 60)
+        self.assertEqual(n, 60)
+        self.assertEqual(pagerank.read_edge_file_header(
+                self.read_edge_file(self.edge_file)), (60, nedges))
+        self.assertRaises(ValueError, edgefile.convert_edge_list,
+                self.edge_list, self.edge_file, 40)
+
+
+    def test_empty(self):
+        """convert_edge_list() of a list without edges"""
+
+        self.write_edge_list(['# nothing here', '3 3'])
+        self.assertEqual(edgefile.convert_edge_list(self.edge_list,
+                self.edge_file), (0, 0))
+        self.assertEqual(edgefile.convert_edge_list(self.edge_list,
+                self.edge_file, 5), (5, 0))
+
+
+    def test_malformed(self):
+        """convert_edge_list() of malformed lines"""
+
+        self.write_edge_list(['1 2', '3'])
+        self.assertRaises(ValueError, edgefile.convert_edge_list,
+                self.edge_list, self.edge_file)
+        self.write_edge_list(['1 -2'])
+        self.assertRaises(ValueError, edgefile.convert_edge_list,
+                self.edge_list, self.edge_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
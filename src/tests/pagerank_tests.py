@@ -0,0 +1,575 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Tests for the PageRank engines.
+
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+parpath = os.path.join(MODULE_DIR, os.pardir)
+sys.path.insert(0, os.path.abspath(parpath))
+import pagerank
+
+# Error allowed between an engine and the reference solution
+PLACES = 1.0e-6
+
+
+def reference_pagerank(graph, d=pagerank.DAMPING, teleport=None):
+    """
+    Solves PageRank by plain power iteration over an edge list, far past
+    convergence. Teleports and the rank of dangling nodes follow
+    `teleport` [default: uniform].
+
+    """
+
+    n = graph.n
+    if teleport is None:
+        teleport = [1. / n] * n
+    edges = [(graph.indices[k], i) for i in range(n)
+            for k in range(graph.indptr[i], graph.indptr[i + 1])]
+    outdeg = [0] * n
+    for src, dst in edges:
+        outdeg[src] += 1
+    scores = list(teleport)
+    for iteration in range(2000):
+        dangling = sum([scores[j] for j in range(n) if not outdeg[j]])
+        jump = (1. - d) + d * dangling
+        new = [jump * teleport[i] for i in range(n)]
+        for src, dst in edges:
+            new[dst] += d * scores[src] / outdeg[src]
+        if sum([abs(a - b) for a, b in zip(new, scores)]) < 1e-15:
+            return new
+        scores = new
+    return scores
+
+
+def random_graph(n, nedges, seed):
+    rng = random.Random(seed)
+    edges = [(rng.randrange(n), rng.randrange(n)) for k in range(nedges)]
+    return pagerank.CSRGraph.from_edges(n, edges)
+
+
+def small_graphs():
+    """
+    Returns a list of small graphs with dangling nodes, several strongly
+    connected components and members no one follows.
+
+    """
+
+    graphs = [
+            pagerank.CSRGraph.from_edges(1, []),
+            pagerank.CSRGraph.from_edges(2, [(0, 1)]),
+            pagerank.CSRGraph.from_edges(4, [(1, 0), (2, 0), (3, 0),
+                (3, 1)]),
+            pagerank.CSRGraph.from_edges(5, [(0, 1), (1, 2), (2, 0),
+                (2, 3), (3, 4), (4, 3)]),
+    ]
+    for seed in range(4):
+        graphs.append(random_graph(30, 70, seed))
+    return graphs
+
+
+class EngineTests(unittest.TestCase):
+    """Tests that every engine agrees with the reference solution."""
+
+    def setUp(self):
+        self.graphs = small_graphs()
+        self.references = [reference_pagerank(graph)
+                for graph in self.graphs]
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def assertScoresEqual(self, scores, expected):
+        self.assertEqual(len(scores), len(expected))
+        error = sum([abs(a - b) for a, b in zip(scores, expected)])
+        self.assert_(error < PLACES, "L1 error %g" % error)
+
+
+    def check_engine(self, solve):
+        for graph, expected in zip(self.graphs, self.references):
+            self.assertScoresEqual(solve(graph).scores, expected)
+
+
+    def test_page_rank(self):
+        """pageRank()"""
+
+        links = [[0, 0, 1, 0], [1, 0, 0, 0], [1, 1, 0, 1], [0, 0, 0, 0]]
+        scores = pagerank.pageRank(links)
+        expected = reference_pagerank(pagerank.CSRGraph.from_links(links))
+        self.assertAlmostEqual(sum(scores), 1.)
+        self.assertEqual(sorted(range(4), key=scores.__getitem__),
+                sorted(range(4), key=expected.__getitem__))
+
+
+    def test_array_pagerank(self):
+        """array_pagerank()"""
+
+        self.check_engine(lambda graph: pagerank.array_pagerank(graph,
+                tol=1e-10))
+
+
+    def test_numpy_pagerank(self):
+        """numpy_pagerank()"""
+
+        if pagerank.numpy is None:
+            return
+        self.check_engine(lambda graph: pagerank.numpy_pagerank(graph,
+                tol=1e-10))
+
+
+    def test_parallel_pagerank(self):
+        """parallel_pagerank()"""
+
+        if pagerank.multiprocessing is None:
+            return
+        self.check_engine(lambda graph: pagerank.parallel_pagerank(graph,
+                tol=1e-10, processes=2))
+
+
+    def test_delta_pagerank(self):
+        """delta_pagerank()"""
+
+        self.check_engine(lambda graph: pagerank.delta_pagerank(graph,
+                tol=1e-9))
+
+
+    def test_delta_pagerank_array(self):
+        """delta_pagerank() without NumPy"""
+
+        numpy = pagerank.numpy
+        pagerank.numpy = None
+        try:
+            self.check_engine(lambda graph: pagerank.delta_pagerank(graph,
+                    tol=1e-9))
+            results = [pagerank.delta_pagerank(graph, tol=1e-6)
+                    for graph in self.graphs]
+        finally:
+            pagerank.numpy = numpy
+        if numpy is None:
+            return
+        for graph, result in zip(self.graphs, results):
+            expected = pagerank.delta_pagerank(graph, tol=1e-6)
+            self.assertEqual(result.relaxations, expected.relaxations)
+            self.assertEqual(result.visits, expected.visits)
+
+
+    def test_delta_pagerank_error_bound(self):
+        """delta_pagerank() residual bounds the error"""
+
+        for graph, expected in zip(self.graphs, self.references):
+            result = pagerank.delta_pagerank(graph, tol=1e-4)
+            error = sum([abs(a - b) for a, b in zip(result.scores,
+                    expected)])
+            self.assert_(error <= result.residual + 1e-12)
+
+
+    def test_scc_pagerank(self):
+        """scc_pagerank()"""
+
+        self.check_engine(lambda graph: pagerank.scc_pagerank(graph,
+                tol=1e-10))
+
+
+    def test_accelerated_pagerank(self):
+        """accelerated_pagerank()"""
+
+        for method in ['quadratic', 'gauss-seidel']:
+            self.check_engine(lambda graph: pagerank.accelerated_pagerank(
+                    graph, tol=1e-10, method=method, period=4))
+        self.assertRaises(ValueError, pagerank.accelerated_pagerank,
+                self.graphs[2], method='aitken')
+
+
+    def test_mmap_pagerank(self):
+        """mmap_pagerank()"""
+
+        if pagerank.mmap is None:
+            return
+        path = os.path.join(self.directory, 'graph.edges')
+
+        def solve(graph):
+            pagerank.write_edge_file(graph, path)
+            return pagerank.mmap_pagerank(path, tol=1e-10, chunk_edges=16)
+
+        self.check_engine(solve)
+
+
+    def test_multi_pagerank(self):
+        """multi_pagerank()"""
+
+        results = pagerank.multi_pagerank(self.graphs, tol=1e-10)
+        for result, expected in zip(results, self.references):
+            self.assertScoresEqual(result.scores, expected)
+
+
+    def test_multi_pagerank_array(self):
+        """multi_pagerank() without NumPy"""
+
+        numpy = pagerank.numpy
+        pagerank.numpy = None
+        try:
+            results = pagerank.multi_pagerank(self.graphs, tol=1e-10)
+        finally:
+            pagerank.numpy = numpy
+        for result, expected in zip(results, self.references):
+            self.assertScoresEqual(result.scores, expected)
+
+
+    def test_multi_pagerank_max_iter(self):
+        """multi_pagerank() with max_iter=0"""
+
+        results = pagerank.multi_pagerank(self.graphs, tol=0, max_iter=0)
+        for graph, result in zip(self.graphs, results):
+            self.assertEqual(result.iterations, 0)
+            self.assertEqual(result.scores, [1. / graph.n] * graph.n)
+
+
+    def check_personalized(self):
+        for graph in self.graphs:
+            teleports = [pagerank.teleport_vector(graph.n, [i])
+                    for i in range(min(graph.n, 3))]
+            results = pagerank.personalized_pagerank(graph, teleports,
+                    tol=1e-10, block_size=2)
+            for teleport, result in zip(teleports, results):
+                self.assertScoresEqual(result.scores,
+                        reference_pagerank(graph, teleport=teleport))
+
+
+    def test_personalized_pagerank(self):
+        """personalized_pagerank()"""
+
+        self.check_personalized()
+
+
+    def test_personalized_pagerank_array(self):
+        """personalized_pagerank() without NumPy"""
+
+        numpy = pagerank.numpy
+        pagerank.numpy = None
+        try:
+            self.check_personalized()
+        finally:
+            pagerank.numpy = numpy
+
+
+    def test_personalized_pagerank_max_iter(self):
+        """personalized_pagerank() with max_iter=0"""
+
+        graph = self.graphs[-1]
+        teleports = [pagerank.teleport_vector(graph.n, [i])
+                for i in range(3)]
+        results = pagerank.personalized_pagerank(graph, teleports, tol=0,
+                max_iter=0)
+        for teleport, result in zip(teleports, results):
+            self.assertEqual(result.iterations, 0)
+            self.assertEqual(list(result.scores), list(teleport))
+
+
+    def test_local_pagerank(self):
+        """local_pagerank() within its residual bound"""
+
+        epsilon = 1e-4
+        for graph in self.graphs:
+            for seed in range(min(graph.n, 3)):
+                exact = reference_pagerank(graph,
+                        teleport=pagerank.teleport_vector(graph.n, [seed]))
+                scores, residuals = pagerank.local_pagerank(graph, seed,
+                        epsilon=epsilon)
+                for v, residual in residuals.items():
+                    self.assert_(residual <= epsilon *
+                            max(graph.outdeg[v], 1))
+                # Scores only undershoot, by the residual mass left
+                shortfall = [exact[i] - scores.get(i, 0.)
+                        for i in range(graph.n)]
+                self.assert_(min(shortfall) > -1e-12)
+                self.assertAlmostEqual(sum(shortfall),
+                        sum(residuals.values()))
+
+
+    def test_montecarlo_pagerank(self):
+        """montecarlo_pagerank() bounds holding the exact scores"""
+
+        graph = self.graphs[-1]
+        expected = self.references[-1]
+        result = pagerank.montecarlo_pagerank(graph, k=5, z=3.,
+                walks_per_round=2000, seed=1)
+        self.assertEqual(len(result.top), 5)
+        for node, score, low, high in result.top:
+            self.assert_(low <= expected[node] <= high)
+            self.assert_(low <= score <= high)
+        best = max(range(graph.n), key=expected.__getitem__)
+        self.assertEqual(result.top[0][0], best)
+        again = pagerank.montecarlo_pagerank(graph, k=5, z=3.,
+                walks_per_round=2000, seed=1)
+        self.assertEqual(again.top, result.top)
+
+
+    def test_reorder(self):
+        """reorder() leaving each node's score unchanged"""
+
+        for method in ['degree', 'bfs', 'rcm']:
+            for graph, expected in zip(self.graphs, self.references):
+                order = pagerank.node_order(graph, method)
+                self.assertEqual(sorted(order), range(graph.n))
+                reordered = pagerank.reorder(graph, method)
+                scores = pagerank.array_pagerank(reordered,
+                        tol=1e-10).scores
+                # Undo the permutation: new node k was node order[k]
+                restored = [0.] * graph.n
+                for new, old in enumerate(order):
+                    restored[old] = scores[new]
+                self.assertScoresEqual(restored, expected)
+                self.assertEqual(reordered.scores_by_label(scores),
+                        graph.scores_by_label(restored))
+        self.assertRaises(ValueError, pagerank.reorder, self.graphs[0],
+                'bogus')
+
+
+    def test_pagerank_compact(self):
+        """pagerank() with compact=True"""
+
+        graph = self.graphs[-1]
+        for backend in sorted(pagerank.BACKENDS):
+            if backend == 'numpy' and pagerank.numpy is None:
+                continue
+            if backend in pagerank.COMPACT_BACKENDS:
+                result = pagerank.pagerank(graph.compact(),
+                        backend=backend, compact=True)
+                error = sum([abs(a - b) for a, b in zip(result.scores,
+                        self.references[-1])])
+                self.assert_(error < 1e-4)
+            else:
+                self.assertRaises(ValueError, pagerank.pagerank, graph,
+                        backend=backend, compact=True)
+
+
+
+    def test_compact_parallel_edges(self):
+        """compact() with an out-degree past the 16-bit index type"""
+
+        graph = pagerank.CSRGraph.from_edges(3, [(0, 1)] * 70000 +
+                [(1, 2), (2, 0)])
+        small = graph.compact()
+        self.assertEqual(small.indices.typecode, 'H')
+        self.assertEqual(small.outdeg[0], 70000)
+        result = pagerank.pagerank(small, backend='array', compact=True)
+        error = sum([abs(a - b) for a, b in zip(result.scores,
+                reference_pagerank(graph))])
+        self.assert_(error < 1e-4)
+        self.assertEqual(self.graphs[-1].compact().outdeg.typecode, 'H')
+
+
+    def test_footprint(self):
+        """footprint() of the full and compact forms"""
+
+        graph = self.graphs[-1]
+        small = graph.compact()
+        self.assertEqual(pagerank.footprint(graph, 'array'),
+                (graph.indptr.itemsize + graph.outdeg.itemsize + 4 * 8,
+                graph.indices.itemsize))
+        self.assertEqual(pagerank.footprint(small, 'array', True),
+                (4 + 2 + 4 * 4, 2))
+        if pagerank.numpy is None:
+            return
+        per_node, per_edge = pagerank.footprint(graph, 'numpy')
+        compact_node, compact_edge = pagerank.footprint(small, 'numpy',
+                True)
+        self.assert_(compact_node < per_node)
+        self.assertEqual(compact_edge, 2 + 4)
+
+
+    def test_compare_precision(self):
+        """compare_precision() of the compact mode"""
+
+        for backend in sorted(pagerank.COMPACT_BACKENDS):
+            if backend == 'numpy' and pagerank.numpy is None:
+                continue
+            report = pagerank.compare_precision(self.graphs[-1], backend)
+            self.assert_(report['l1_error'] < 1e-4)
+            self.assert_(report['max_error'] <= report['l1_error'])
+            self.assertEqual(report['top20_overlap'], 20)
+            self.assert_(report['compact_bytes_per_node'] <
+                    report['bytes_per_node'])
+            self.assert_(report['compact_bytes_per_edge'] <
+                    report['bytes_per_edge'])
+
+class UpdateTests(unittest.TestCase):
+    """Tests for incremental updates."""
+
+    def setUp(self):
+        graph = random_graph(30, 70, 0)
+        self.labels = ['u%02d' % i for i in range(graph.n)]
+        self.graph = pagerank.CSRGraph(graph.indptr, graph.indices,
+                self.labels)
+        self.previous = pagerank.array_pagerank(self.graph, tol=1e-12)
+
+
+    def labelled_edges(self, graph):
+        return set([(graph.labels[src], graph.labels[dst])
+                for src, dst in graph.edges()])
+
+
+    def test_warm_start(self):
+        """update_pagerank() matching a cold solve"""
+
+        added = [('u00', 'u01'), ('u02', 'new'), ('new', 'u03')]
+        removed = list(self.labelled_edges(self.graph))[:5]
+        graph, result = pagerank.update_pagerank(self.graph,
+                self.previous, added, removed, tol=1e-12, backend='array')
+        cold = pagerank.array_pagerank(graph, tol=1e-12)
+        error = sum([abs(a - b) for a, b in zip(result.scores,
+                cold.scores)])
+        self.assert_(error < 1e-10)
+        self.assert_(result.iterations < cold.iterations)
+        error = sum([abs(a - b) for a, b in zip(result.scores,
+                reference_pagerank(graph))])
+        self.assert_(error < PLACES)
+
+
+    def test_removed_nodes(self):
+        """apply_delta() dropping removed nodes and their edges"""
+
+        graph = self.graph.apply_delta(removed_nodes=['u05', 'u07'])
+        self.assertEqual(graph.labels, [label for label in self.labels
+                if label not in ('u05', 'u07')])
+        self.assertEqual(self.labelled_edges(graph), set([edge
+                for edge in self.labelled_edges(self.graph)
+                if 'u05' not in edge and 'u07' not in edge]))
+        self.assertRaises(ValueError, self.graph.apply_delta,
+                [('u05', 'u00')], removed_nodes=['u05'])
+
+
+    def test_labels(self):
+        """apply_delta() keeping each edge between the same labels"""
+
+        added = [('u00', 'u01'), ('u29', 'new')]
+        removed = list(self.labelled_edges(self.graph))[-3:]
+        graph = self.graph.apply_delta(added, removed)
+        self.assertEqual(graph.labels, self.labels + ['new'])
+        self.assertEqual(self.labelled_edges(graph),
+                (self.labelled_edges(self.graph) | set(added)) -
+                set(removed))
+
+
+    def test_added_nodes(self):
+        """update_pagerank() adding nodes without edges"""
+
+        graph, result = pagerank.update_pagerank(self.graph,
+                self.previous, added_nodes=['u00', 'lone', 'other'],
+                tol=1e-12, backend='array')
+        self.assertEqual(graph.labels, self.labels + ['lone', 'other'])
+        self.assertEqual(graph.nedges, self.graph.nedges)
+        error = sum([abs(a - b) for a, b in zip(result.scores,
+                reference_pagerank(graph))])
+        self.assert_(error < PLACES)
+
+
+    def test_snapshot_pagerank(self):
+        """snapshot_pagerank() carrying scores over by label"""
+
+        first = {'a': ['b'], 'b': ['c'], 'c': ['a', 'd'], 'd': []}
+        # d leaves and e joins; a, b and c keep their labels
+        second = {'a': ['b', 'e'], 'b': ['c'], 'c': ['a'], 'e': ['a']}
+        snapshots = [first, second, second]
+        results = pagerank.snapshot_pagerank(snapshots, tol=1e-12,
+                backend='array')
+        self.assertEqual(len(results), 3)
+        for snapshot, (graph, result) in zip(snapshots, results):
+            self.assertEqual(sorted(graph.labels), sorted(snapshot))
+            self.assertEqual(self.labelled_edges(graph),
+                    set([(follower, followee)
+                        for follower, followees in snapshot.items()
+                        for followee in followees]))
+            error = sum([abs(a - b) for a, b in zip(result.scores,
+                    reference_pagerank(graph))])
+            self.assert_(error < PLACES)
+        # An unchanged snapshot starts from its own solution
+        self.assertEqual(results[2][1].iterations, 1)
+        self.assertEqual(results[2][0].labels, results[1][0].labels)
+
+
+class CheckpointTests(unittest.TestCase):
+    """Tests for PageRank checkpoints."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'run.checkpoint')
+        self.graph = random_graph(30, 70, 0)
+        self.fingerprint = pagerank.graph_fingerprint(self.graph)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_round_trip(self):
+        """write_checkpoint() and read_checkpoint()"""
+
+        scores = [i / 7. for i in range(self.graph.n)]
+        pagerank.write_checkpoint(self.path, self.fingerprint, .85, 12,
+                1e-5, scores)
+        iteration, residual, saved = pagerank.read_checkpoint(self.path,
+                self.fingerprint, .85)
+        self.assertEqual(iteration, 12)
+        self.assertEqual(residual, 1e-5)
+        self.assertEqual(list(saved), scores)
+        self.failIf(os.path.exists(self.path + '.tmp'))
+
+
+    def test_mismatch(self):
+        """read_checkpoint() of another graph or damping factor"""
+
+        pagerank.write_checkpoint(self.path, self.fingerprint, .85, 1, 1.,
+                [1. / self.graph.n] * self.graph.n)
+        other = pagerank.graph_fingerprint(random_graph(30, 70, 1))
+        self.assertEqual(pagerank.read_checkpoint(self.path, other, .85),
+                None)
+        self.assertEqual(pagerank.read_checkpoint(self.path,
+                self.fingerprint, .9), None)
+        self.assertEqual(pagerank.read_checkpoint(self.path + '.missing',
+                self.fingerprint, .85), None)
+
+
+    def test_truncated(self):
+        """read_checkpoint() of a truncated file"""
+
+        pagerank.write_checkpoint(self.path, self.fingerprint, .85, 1, 1.,
+                [1. / self.graph.n] * self.graph.n)
+        size = os.path.getsize(self.path)
+        checkpoint = open(self.path, 'r+b')
+        try:
+            checkpoint.truncate(size - 8)
+        finally:
+            checkpoint.close()
+        self.assertEqual(pagerank.read_checkpoint(self.path,
+                self.fingerprint, .85), None)
+
+
+    def test_resume(self):
+        """checkpointed_pagerank() resuming an interrupted run"""
+
+        expected = pagerank.array_pagerank(self.graph, tol=1e-12)
+        first = pagerank.checkpointed_pagerank(self.graph, self.path,
+                tol=1e-12, max_iter=5, backend='array', interval=0.)
+        self.assertEqual(first.iterations, 5)
+        resumed = pagerank.checkpointed_pagerank(self.graph, self.path,
+                tol=1e-12, backend='array', interval=0.)
+        self.assertEqual(resumed.iterations, expected.iterations)
+        error = sum([abs(a - b) for a, b in zip(resumed.scores,
+                expected.scores)])
+        self.assert_(error < 1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
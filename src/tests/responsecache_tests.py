@@ -0,0 +1,218 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Tests for the response cache.
+
+"""
+
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import threading
+import unittest
+import urllib2
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+parpath = os.path.join(MODULE_DIR, os.pardir)
+sys.path.insert(0, os.path.abspath(parpath))
+import responsecache
+
+API = 'http://friendfeed.com/api'
+
+
+class Clock(object):
+    """A stand-in for the `time` module that only moves when told to."""
+
+    def __init__(self, now=1000000.):
+        self.now = now
+
+
+    def time(self):
+        return self.now
+
+
+class NormalizeTests(unittest.TestCase):
+    """Tests for URI normalization."""
+
+    def test_normalize_uri(self):
+        """normalize_uri()"""
+
+        self.assertEqual(
+                responsecache.normalize_uri(API + '/profiles?b=2&a=1,3'),
+                responsecache.normalize_uri(API + '/profiles?a=1,3&b=2'))
+
+
+    def test_resource_name(self):
+        """resource_name()"""
+
+        self.assertEqual(responsecache.resource_name(
+                API + '/room/the-room/profile?format=json'), 'room')
+        self.assertEqual(responsecache.resource_name(
+                API + '/profiles?nickname=a'), 'profiles')
+
+
+class CachingURLOpenerTests(unittest.TestCase):
+    """Tests for CachingURLOpener."""
+
+    def setUp(self):
+        if responsecache.sqlite3 is None:
+            self.skip = True
+            return
+        self.skip = False
+        self.directory = tempfile.mkdtemp()
+        self.fetched = []
+        self.clock = Clock()
+        self.real_time = responsecache.time
+        responsecache.time = self.clock
+
+        def urlopen(request):
+            uri = request.get_full_url()
+            self.fetched.append(uri)
+            if uri.endswith('missing'):
+                return StringIO.StringIO('{"errorCode": "user-not-found"}')
+            return StringIO.StringIO('{"uri": "%s", "padding": "%s"}' % (
+                    uri, 'x' * 100))
+
+        self.opener = responsecache.CachingURLOpener(
+                os.path.join(self.directory, 'cache.sqlite'), urlopen,
+                ttls={'room': 60, 'profiles': 600}, default_ttl=10)
+
+
+    def tearDown(self):
+        if self.skip:
+            return
+        self.opener.close()
+        responsecache.time = self.real_time
+        shutil.rmtree(self.directory)
+
+
+    def get(self, path):
+        return self.opener(urllib2.Request(API + path)).read()
+
+
+    def test_hit(self):
+        """__call__() answering from the cache"""
+
+        if self.skip:
+            return
+        first = self.get('/room/a/profile')
+        second = self.get('/room/a/profile')
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual((self.opener.hits, self.opener.misses), (1, 1))
+
+
+    def test_counts_threads(self):
+        """__call__() counting hits and misses from several threads"""
+
+        if self.skip:
+            return
+
+        def get():
+            for i in range(50):
+                self.get('/room/a/profile')
+
+        threads = [threading.Thread(target=get) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.opener.hits + self.opener.misses, 200)
+        self.assertEqual(self.opener.misses, len(self.fetched))
+
+
+    def test_directory_mode(self):
+        """__init__() creating a directory only its owner can read"""
+
+        if self.skip:
+            return
+        directory = os.path.join(self.directory, 'config', 'roomranker')
+        opener = responsecache.CachingURLOpener(os.path.join(directory,
+                'cache.sqlite'))
+        opener.close()
+        self.assertEqual(os.stat(directory).st_mode & 0777, 0700)
+
+
+    def test_ttl(self):
+        """__call__() refetching expired responses"""
+
+        if self.skip:
+            return
+        self.get('/room/a/profile')
+        self.get('/profiles?nickname=a')
+        self.clock.now += 61
+        self.get('/room/a/profile')
+        self.get('/profiles?nickname=a')
+        self.assertEqual(len(self.fetched), 3)
+        self.assertEqual(self.opener.ttl(API + '/feed/home'), 10)
+
+
+    def test_max_age(self):
+        """ttl() capped by max_age"""
+
+        if self.skip:
+            return
+        self.opener.max_age = 30
+        self.assertEqual(self.opener.ttl(API + '/profiles?nickname=a'), 30)
+        self.assertEqual(self.opener.ttl(API + '/feed/home'), 10)
+
+
+    def test_errors_not_stored(self):
+        """__call__() not storing error responses"""
+
+        if self.skip:
+            return
+        self.get('/user/missing')
+        self.get('/user/missing')
+        self.assertEqual(len(self.fetched), 2)
+
+
+    def test_credentials(self):
+        """__call__() keeping credentials apart"""
+
+        if self.skip:
+            return
+        self.get('/room/a/profile')
+        request = urllib2.Request(API + '/room/a/profile',
+                headers={'Authorization': 'Basic dXNlcjpwYXNz'})
+        self.opener(request).read()
+        self.assertEqual(len(self.fetched), 2)
+
+
+    def test_eviction(self):
+        """store() evicting the least recently used responses"""
+
+        if self.skip:
+            return
+        size = len(self.get('/room/a/profile'))
+        self.opener.max_bytes = 2 * size + 10
+        self.clock.now += 1
+        self.get('/room/b/profile')
+        self.clock.now += 1
+        # Using a makes b the least recently used
+        self.get('/room/a/profile')
+        self.clock.now += 1
+        self.get('/room/c/profile')
+        del self.fetched[:]
+        self.get('/room/a/profile')
+        self.get('/room/c/profile')
+        self.assertEqual(self.fetched, [])
+        self.get('/room/b/profile')
+        self.assertEqual(self.fetched, [API + '/room/b/profile'])
+
+
+    def test_clear(self):
+        """clear()"""
+
+        if self.skip:
+            return
+        self.get('/room/a/profile')
+        self.opener.clear()
+        self.get('/room/a/profile')
+        self.assertEqual(len(self.fetched), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Tests for the roomranker crawler and rankings.
+
+"""
+
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+import urlparse
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+parpath = os.path.join(MODULE_DIR, os.pardir)
+sys.path.insert(0, os.path.abspath(parpath))
+import friendfeed
+import roomranker
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class RankingTests(unittest.TestCase):
+    """Tests for generate_rankings."""
+
+    def setUp(self):
+        # b, c and d have two followers each, a one and e none
+        self.followers = {
+                'a': ['b'],
+                'b': ['a', 'c'],
+                'c': ['a', 'b'],
+                'd': ['a', 'e'],
+                'e': [],
+        }
+
+
+    def test_indegree(self):
+        """generate_rankings() ties broken by nickname"""
+
+        self.assertEqual(roomranker.generate_rankings(self.followers),
+                [('b', 2), ('c', 2), ('d', 2), ('a', 1), ('e', 0)])
+
+
+    def test_indegree_top(self):
+        """generate_rankings() with top cutting through a tie"""
+
+        self.assertEqual(roomranker.generate_rankings(self.followers,
+                top=2), [('b', 2), ('c', 2)])
+        self.assertEqual(roomranker.generate_rankings(
+                self.followers.iteritems(), top=4),
+                [('b', 2), ('c', 2), ('d', 2), ('a', 1)])
+
+
+    def test_self_follows(self):
+        """generate_rankings() not counting self-follows"""
+
+        self.assertEqual(roomranker.generate_rankings({'a': ['a', 'b'],
+                'b': []}), [('a', 1), ('b', 0)])
+
+
+    def test_pagerank_top(self):
+        """generate_rankings() with top and the PageRank engine"""
+
+        followers = {'a': ['c'], 'b': ['c'], 'c': [], 'd': []}
+        full = roomranker.generate_rankings(followers, 'pagerank')
+        self.assertEqual([nickname for nickname, score in full],
+                ['a', 'b', 'c', 'd'])
+        self.assertEqual(full[0][1], full[1][1])
+        self.assertEqual(roomranker.generate_rankings(followers,
+                'pagerank', top=2), full[:2])
+
+
+class SnapshotTests(unittest.TestCase):
+    """Tests for room snapshots."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = roomranker.snapshot_path('room', self.directory)
+        self.snapshot = {
+                'room': 'room',
+                'taken': 1000.,
+                'follows': {
+                    'a': ['b', 'outsider'],
+                    'b': [],
+                    'c': ['a', 'b'],
+                },
+                'checked': {'a': 900., 'b': 1000., 'c': 800.},
+        }
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_round_trip(self):
+        """save_snapshot() and load_snapshot()"""
+
+        roomranker.save_snapshot(self.path, self.snapshot)
+        self.assertEqual(roomranker.load_snapshot(self.path),
+                self.snapshot)
+        self.failIf(os.path.exists(self.path + '.tmp'))
+
+
+    def test_synced(self):
+        """save_snapshot() syncing the file before renaming it"""
+
+        calls = []
+        real_fsync, real_rename = os.fsync, os.rename
+
+        def fsync(fd):
+            calls.append('fsync')
+            real_fsync(fd)
+
+        def rename(source, destination):
+            calls.append('rename')
+            real_rename(source, destination)
+
+        os.fsync, os.rename = fsync, rename
+        try:
+            roomranker.save_snapshot(self.path, self.snapshot)
+        finally:
+            os.fsync, os.rename = real_fsync, real_rename
+        self.assertEqual(calls, ['fsync', 'rename'])
+
+
+    def test_missing(self):
+        """load_snapshot() without a snapshot"""
+
+        self.assertEqual(roomranker.load_snapshot(self.path), None)
+
+
+    def test_corrupt(self):
+        """load_snapshot() of a damaged file"""
+
+        roomranker.save_snapshot(self.path, self.snapshot)
+        snapshot_file = open(self.path, 'r+b')
+        try:
+            snapshot_file.truncate(10)
+        finally:
+            snapshot_file.close()
+        self.assertEqual(roomranker.load_snapshot(self.path), None)
+
+
+    def test_members_to_fetch_without_snapshot(self):
+        """members_to_fetch() without a snapshot"""
+
+        self.assertEqual(roomranker.members_to_fetch(set(['a', 'b']),
+                None), set(['a', 'b']))
+
+
+    def test_members_to_fetch(self):
+        """members_to_fetch() taking new and least recently checked"""
+
+        members = set(['a', 'b', 'c', 'd'])
+        # c was checked longest ago; b has left
+        self.assertEqual(roomranker.members_to_fetch(members,
+                self.snapshot, .1), set(['c', 'd']))
+        self.assertEqual(roomranker.members_to_fetch(members,
+                self.snapshot, .5), set(['a', 'c', 'd']))
+        self.assertEqual(roomranker.members_to_fetch(members,
+                self.snapshot, 0.), set(['d']))
+
+
+class CrawlTests(unittest.TestCase):
+    """Tests for crawling rooms through a simulated API."""
+
+    def setUp(self):
+        self.members = ['user%02d' % i for i in range(40)]
+        self.follows = {}
+        for i, nickname in enumerate(self.members):
+            self.follows[nickname] = [self.members[(i + 1) % 40],
+                    self.members[(i * 7) % 40], 'outsider']
+        self.requested = []
+        self.failing = set()
+
+        def urlopen(request):
+            uri = request.get_full_url()
+            path = urlparse.urlparse(uri).path
+            if path.startswith('/api/room/'):
+                if path.split('/')[3] in self.failing:
+                    raise IOError('timed out')
+                return StringIO.StringIO(json.dumps({
+                        'nickname': 'room',
+                        'members': [{'nickname': nickname}
+                            for nickname in self.members]}))
+            query = urlparse.urlparse(uri).query
+            nicknames = urlparse.parse_qs(query)['nickname'][0].split(',')
+            if self.failing.intersection(nicknames):
+                raise IOError('timed out')
+            self.requested.extend(nicknames)
+            return StringIO.StringIO(json.dumps({'profiles': [
+                    {'nickname': nickname, 'subscriptions': [
+                        {'nickname': followee}
+                        for followee in self.follows[nickname]]}
+                    for nickname in nicknames]}))
+
+        self.api = friendfeed.FriendFeedAPI(urlopen=urlopen)
+
+
+    def crawl(self, snapshots=None, refresh=.1):
+        return list(roomranker.crawl_rooms(self.api, ['room'], 2, None,
+                snapshots, refresh))[0][1]
+
+
+    def test_crawl_room(self):
+        """crawl_room()"""
+
+        room, followers = roomranker.crawl_room(self.api, 'room')
+        self.assertEqual(sorted(followers), self.members)
+        self.assertEqual(sorted(followers['user01']),
+                ['user00', 'user23'])
+
+
+    def test_incremental(self):
+        """crawl_rooms() refetching only part of a snapshot"""
+
+        snapshots = {}
+        full = self.crawl(snapshots)
+        self.assertEqual(sorted(self.requested), self.members)
+        self.assertEqual(sorted(snapshots['room']['follows']),
+                self.members)
+        del self.requested[:]
+        self.members.append('user40')
+        self.follows['user40'] = ['user00']
+        again = self.crawl(snapshots)
+        # The new member and a tenth of the others
+        self.assertEqual(len(self.requested), 5)
+        self.assert_('user40' in self.requested)
+        full['user40'] = []
+        full['user00'].append('user40')
+        self.assertEqual(dict((k, sorted(v)) for k, v in again.items()),
+                dict((k, sorted(v)) for k, v in full.items()))
+
+
+    def test_failed_request(self):
+        """crawl_rooms() with a failing request"""
+
+        snapshots = {}
+        full = self.crawl(snapshots)
+        self.failing.add('user05')
+        # Members of the failed request keep their snapshot follows
+        self.assertEqual(self.crawl(snapshots, 1.), full)
+        self.failing.add('user06')
+        followers = self.crawl()
+        self.assertEqual(sorted(followers), self.members)
+
+
+    def test_failed_room(self):
+        """crawl_rooms() skipping a room that cannot be fetched"""
+
+        self.failing.add('broken')
+        crawled = list(roomranker.crawl_rooms(self.api, ['broken', 'room'],
+                2))
+        self.assertEqual([room.nickname for room, followers in crawled],
+                ['room'])
+        self.assertEqual(sorted(crawled[0][1]), self.members)
+
+
+if __name__ == '__main__':
+    unittest.main()